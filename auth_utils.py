@@ -1,52 +1,81 @@
 from datetime import datetime, timedelta, timezone
 import os
+import uuid
 from typing import Optional, Union, Literal
 
 import jwt
 from fastapi import HTTPException, status
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
 import models
+from datamanager.revocation import revocation_list
 from fastapi.security import OAuth2PasswordBearer
+from password_hashing import (  # noqa: F401  re-exported for existing imports
+    verify_password,
+    verify_and_update_password,
+    get_password_hash
+)
 
 SECRET_KEY = os.environ.get('SECRET_KEY')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Put role and disabled state in tokens so authorization needs no database lookup
+STATELESS_TOKENS = os.environ.get('STATELESS_TOKENS', '0') == '1'
 
 # Define separate schemes for users and artists
 user_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/token")
 artist_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="artists/token")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+class TokenPrincipal:
+    """
+    The user or artist described by a claims-bearing token, used in place of
+    the ORM row when STATELESS_TOKENS is on.
+    """
+    __slots__ = ("id", "role", "disabled", "token_type")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    def __init__(self, id: int, role: str, disabled: bool, token_type: str):
+        self.id = id
+        self.role = role
+        self.disabled = disabled
+        self.token_type = token_type
 
 
 def create_access_token(
         data: dict,
         expires_delta: Optional[timedelta] = None,
-        token_type: Literal["user", "artist"] = "user"
+        token_type: Literal["user", "artist"] = "user",
+        entity: Optional[Union[models.User, models.Artist]] = None
 ) -> str:
     to_encode = data.copy()
+    now = datetime.now(timezone.utc)
     if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
+        expire = now + timedelta(minutes=15)
 
     to_encode.update({
         "exp": expire,
+        "iat": now.timestamp(),
+        "jti": uuid.uuid4().hex,
         "token_type": token_type
     })
+    if STATELESS_TOKENS and entity is not None:
+        to_encode.update({
+            "role": getattr(entity.role, "value", entity.role),
+            "disabled": bool(entity.disabled)
+        })
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def load_entity(db: Session, entity: Union[models.User, models.Artist, TokenPrincipal]):
+    """Return the ORM row for a principal, for handlers that need more than the claims."""
+    if not isinstance(entity, TokenPrincipal):
+        return entity
+    model = models.User if entity.token_type == "user" else models.Artist
+    return db.query(model).filter(model.id == entity.id).first()
+
+
 def get_current_entity(
         token: str,
         db: Session,
@@ -77,6 +106,17 @@ def get_current_entity(
     except jwt.InvalidTokenError:
         raise credentials_exception
 
+    if revocation_list.is_revoked(token_type, str(entity_id), payload.get("jti"), payload.get("iat", 0)):
+        raise credentials_exception
+
+    if STATELESS_TOKENS and "role" in payload and "disabled" in payload:
+        return TokenPrincipal(
+            id=int(entity_id),
+            role=payload["role"],
+            disabled=payload["disabled"],
+            token_type=token_type
+        )
+
     # Query appropriate model based on token type
     if token_type == "user":
         entity = db.query(models.User).filter(models.User.id == entity_id).first()
@@ -0,0 +1,82 @@
+"""
+Response size and encoding cost per format.
+
+    python serve.py &
+    python benchmarks/bench_encoding.py --url "http://localhost:8000/tracks/?limit=100" --iterations 200
+
+For each format (JSON or MessagePack, each uncompressed, gzip or brotli) it
+fetches the URL once to record the bytes on the wire, then re-encodes that
+response body locally to report the CPU time the server spends per response.
+Cached responses that reuse a precompressed body skip the compression cost.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from middleware.encoding import brotli, compress, msgpack  # noqa: E402
+
+FORMATS = [
+    ("json", None),
+    ("json", "gzip"),
+    ("json", "br"),
+    ("msgpack", None),
+    ("msgpack", "gzip"),
+    ("msgpack", "br"),
+]
+
+
+def wire_bytes(client: httpx.Client, url: str, media_type: str, encoding) -> int:
+    headers = {
+        "Accept": "application/msgpack" if media_type == "msgpack" else "application/json",
+        "Accept-Encoding": encoding or "identity",
+    }
+    with client.stream("GET", url, headers=headers) as response:
+        response.raise_for_status()
+        return sum(len(chunk) for chunk in response.iter_raw())
+
+
+def cpu_per_response(payload, media_type: str, encoding, iterations: int) -> float:
+    """
+    CPU microseconds to produce one response body the way the server does:
+    JSON serialization, then the middleware's MessagePack transcode and compression.
+    """
+    started = time.process_time()
+    for _ in range(iterations):
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        if media_type == "msgpack":
+            body = msgpack.packb(json.loads(body))
+        if encoding is not None:
+            compress(body, encoding)
+    return (time.process_time() - started) / iterations * 1_000_000
+
+
+def run(url: str, iterations: int) -> list:
+    with httpx.Client(timeout=30) as client:
+        payload = client.get(url, headers={"Accept": "application/json"}).json()
+        results = []
+        for media_type, encoding in FORMATS:
+            if (media_type == "msgpack" and msgpack is None) or (encoding == "br" and brotli is None):
+                continue
+            results.append({
+                "format": media_type + (f"+{encoding}" if encoding else ""),
+                "wire_bytes": wire_bytes(client, url, media_type, encoding),
+                "cpu_us": round(cpu_per_response(payload, media_type, encoding, iterations), 1),
+            })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000/tracks/?limit=100")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'format':<16}{'wire bytes':>12}{'cpu us':>10}")
+    for result in run(args.url, args.iterations):
+        print(f"{result['format']:<16}{result['wire_bytes']:>12}{result['cpu_us']:>10}")
@@ -0,0 +1,59 @@
+"""
+Throughput benchmark against a running HarmonApp server.
+
+    python serve.py &
+    python benchmarks/bench_server.py --url http://localhost:8000/tracks/ --requests 5000 --concurrency 64
+
+Reports requests per second and latency percentiles.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def _worker(client: httpx.AsyncClient, url: str, count: int, latencies: list, errors: list):
+    for _ in range(count):
+        started = time.perf_counter()
+        try:
+            response = await client.get(url)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+        except httpx.HTTPError as error:
+            errors.append(type(error).__name__)
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(url: str, total: int, concurrency: int) -> dict:
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        per_worker = total // concurrency
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            _worker(client, url, per_worker, latencies, errors) for _ in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000/tracks/")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    for key, value in asyncio.run(run(args.url, args.requests, args.concurrency)).items():
+        print(f"{key}: {value}")
@@ -0,0 +1,55 @@
+"""
+Boot latency benchmark.
+
+    python benchmarks/bench_startup.py --runs 5
+
+Each run starts a fresh interpreter and reports the time to import main,
+to run the lifespan startup (create_all, pool warm-up) and to produce the
+OpenAPI document. Set OPENAPI_SCHEMA_PATH to compare against a prebuilt schema.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEASURE = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def startup():
+    async with main.lifespan(main.app):
+        ready = time.perf_counter()
+        main.app.openapi()
+        return ready, time.perf_counter()
+
+ready, schema = asyncio.run(startup())
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+    "openapi_ms": (schema - ready) * 1000,
+}))
+"""
+
+
+def run_once() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    for key in results[0]:
+        print(f"{key}: median {statistics.median(r[key] for r in results):.1f}")
@@ -0,0 +1,47 @@
+"""
+Pick the bcrypt cost for this hardware.
+
+    python calibrate_password_hashing.py --target-ms 250
+
+Times one hash at each cost factor and recommends the highest one that
+stays within the latency budget. Set the result as BCRYPT_ROUNDS; existing
+hashes are upgraded (or downgraded) transparently on the next login.
+"""
+import argparse
+import statistics
+import time
+
+from password_hashing import build_pwd_context, BCRYPT_ROUNDS
+
+MIN_ROUNDS = 4
+MAX_ROUNDS = 16
+
+
+def time_hash(rounds: int, samples: int) -> float:
+    context = build_pwd_context(rounds)
+    # The first call loads the bcrypt backend
+    context.hash("warm-up")
+    durations = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.hash("calibration-password")
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--samples", type=int, default=3)
+    args = parser.parse_args()
+
+    chosen = MIN_ROUNDS
+    print(f"current BCRYPT_ROUNDS={BCRYPT_ROUNDS}")
+    for rounds in range(MIN_ROUNDS, MAX_ROUNDS + 1):
+        duration = time_hash(rounds, args.samples)
+        print(f"rounds={rounds:2d}  {duration:8.1f} ms")
+        if duration > args.target_ms:
+            break
+        chosen = rounds
+
+    print(f"\nRecommended: BCRYPT_ROUNDS={chosen}")
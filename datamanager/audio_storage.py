@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+from python_multipart.multipart import MultipartParseError, MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+AUDIO_STORAGE_DIR = os.environ.get('AUDIO_STORAGE_DIR', 'audio')
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 200 * 1024 * 1024))
+# Combined size of the non-file form fields of an upload
+MAX_FORM_FIELD_BYTES = 64 * 1024
+MAX_CONCURRENT_UPLOADS = int(os.environ.get('MAX_CONCURRENT_UPLOADS', 4))
+AUDIO_EXTENSIONS = {'.wav', '.mp3', '.flac', '.ogg', '.m4a'}
+
+# Uploads beyond this many per worker are turned away instead of queued
+upload_slots = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+
+
+class UploadTooLargeError(ValueError):
+    pass
+
+
+class UnsupportedAudioTypeError(ValueError):
+    pass
+
+
+class MalformedUploadError(ValueError):
+    pass
+
+
+def content_path(content_hash: str, extension: str) -> str:
+    return os.path.join(AUDIO_STORAGE_DIR, content_hash[:2], f"{content_hash}{extension}")
+
+
+class StagedUpload:
+    """An uploaded file written to a temporary path and hashed, not yet stored."""
+
+    def __init__(self, temp_path: str, content_hash: str, extension: str):
+        self.temp_path = temp_path
+        self.content_hash = content_hash
+        self.extension = extension
+        # Whether store() added the file rather than reusing an existing copy
+        self.created = False
+
+    def store(self) -> str:
+        """Move the file under its SHA-256, reusing an existing copy of the same content."""
+        stored_path = content_path(self.content_hash, self.extension)
+        if os.path.exists(stored_path):
+            os.remove(self.temp_path)
+        else:
+            os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+            os.replace(self.temp_path, stored_path)
+            self.created = True
+        return stored_path
+
+    def discard(self) -> None:
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class _UploadParser:
+    """
+    Feeds a multipart/form-data body through python-multipart. The part
+    named `file` goes straight into a temporary file while being hashed;
+    every other part is kept as a small text field.
+    """
+
+    def __init__(self, boundary: bytes):
+        self.fields: Dict[str, str] = {}
+        self.extension: Optional[str] = None
+        self.temp_file = None
+        self.temp_path: Optional[str] = None
+        self.digest = hashlib.sha256()
+        self.file_size = 0
+        self.field_bytes = 0
+
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: Dict[bytes, bytes] = {}
+        self._name: Optional[str] = None
+        self._is_file = False
+        self._value = bytearray()
+        # File bytes parsed from the current body chunk, written in one call
+        self._pending: List[bytes] = []
+
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._name = None
+        self._is_file = False
+        self._value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        disposition, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if disposition != b"form-data" or b"name" not in options:
+            raise MalformedUploadError("Multipart part without a form-data name")
+        self._name = options[b"name"].decode("latin-1")
+        if b"filename" not in options:
+            return
+        if self._name != "file" or self.temp_path is not None:
+            raise MalformedUploadError("Only one file, in the `file` field, can be uploaded")
+
+        filename = options[b"filename"].decode("utf-8", "replace")
+        self.extension = os.path.splitext(filename)[1].lower()
+        if self.extension not in AUDIO_EXTENSIONS:
+            raise UnsupportedAudioTypeError(f"Unsupported audio file type: {self.extension or 'none'}")
+        os.makedirs(AUDIO_STORAGE_DIR, exist_ok=True)
+        temp_fd, self.temp_path = tempfile.mkstemp(dir=AUDIO_STORAGE_DIR, suffix='.part')
+        self.temp_file = os.fdopen(temp_fd, 'wb')
+        self._is_file = True
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._is_file:
+            self.file_size += end - start
+            if self.file_size > MAX_UPLOAD_BYTES:
+                raise UploadTooLargeError(f"File exceeds {MAX_UPLOAD_BYTES} bytes")
+            chunk = data[start:end]
+            self.digest.update(chunk)
+            self._pending.append(chunk)
+        else:
+            self.field_bytes += end - start
+            if self.field_bytes > MAX_FORM_FIELD_BYTES:
+                raise UploadTooLargeError(f"Form fields exceed {MAX_FORM_FIELD_BYTES} bytes")
+            self._value += data[start:end]
+
+    def _on_part_end(self) -> None:
+        if not self._is_file:
+            self.fields[self._name] = self._value.decode("utf-8", "replace")
+
+    async def feed(self, chunk: bytes) -> None:
+        self.parser.write(chunk)
+        if self._pending:
+            data = b"".join(self._pending)
+            self._pending = []
+            await run_in_threadpool(self.temp_file.write, data)
+
+    def close(self) -> None:
+        if self.temp_file is not None:
+            self.temp_file.close()
+
+
+async def receive_upload(request: Request) -> Tuple[Dict[str, str], StagedUpload]:
+    """
+    Parse a multipart upload straight from the request stream. The audio in
+    `file` is written to a temporary file and hashed as it arrives, so the
+    body is never buffered; reading stops as soon as a size limit is passed.
+    Returns the other form fields and the staged file, which the caller
+    stores once the fields are valid.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise MalformedUploadError("Expected a multipart/form-data body")
+
+    upload = _UploadParser(options[b"boundary"])
+    received = 0
+    try:
+        try:
+            async for chunk in request.stream():
+                received += len(chunk)
+                if received > MAX_UPLOAD_BYTES + MAX_FORM_FIELD_BYTES:
+                    raise UploadTooLargeError(f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+                await upload.feed(chunk)
+            upload.parser.finalize()
+        except MultipartParseError as error:
+            raise MalformedUploadError(f"Invalid multipart body: {error}")
+        finally:
+            upload.close()
+        if upload.temp_path is None:
+            raise MalformedUploadError("Missing audio file")
+    except BaseException:
+        if upload.temp_path is not None and os.path.exists(upload.temp_path):
+            os.remove(upload.temp_path)
+        raise
+
+    return upload.fields, StagedUpload(upload.temp_path, upload.digest.hexdigest(), upload.extension)
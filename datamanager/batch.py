@@ -0,0 +1,23 @@
+from typing import List, Optional, Sequence, Tuple, Type
+
+from sqlalchemy.orm import Session
+
+from datamanager.database import Base
+
+
+def get_many_by_ids(
+        db: Session,
+        model: Type[Base],
+        ids: Sequence[int]
+) -> Tuple[List[Optional[Base]], List[int]]:
+    """
+    Resolve many primary keys with a single WHERE id IN (...) query.
+    Returns the rows in the requested order (None for a miss) and the missing ids.
+    """
+    unique_ids = list(dict.fromkeys(ids))
+    rows = db.query(model).filter(model.id.in_(unique_ids)).all() if unique_ids else []
+    rows_by_id = {row.id: row for row in rows}
+
+    items = [rows_by_id.get(item_id) for item_id in ids]
+    missing = [item_id for item_id in unique_ids if item_id not in rows_by_id]
+    return items, missing
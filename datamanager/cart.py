@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from datamanager.shared_store import SharedStore, get_shared_store
+
+# Carts untouched for this long are dropped
+CART_TTL_SECONDS = int(os.environ.get('CART_TTL_SECONDS', 7 * 24 * 60 * 60))
+MAX_CART_LINES = int(os.environ.get('MAX_CART_LINES', 100))
+MEMORY_CART_MAX_USERS = 100_000
+
+CartKey = Tuple[str, int]
+
+
+class CartFullError(Exception):
+    pass
+
+
+class MemoryCartStore:
+    """Per-process carts, least recently used carts evicted past MEMORY_CART_MAX_USERS."""
+
+    def __init__(self, max_users: int = MEMORY_CART_MAX_USERS, ttl: int = CART_TTL_SECONDS):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._carts: "OrderedDict[int, Tuple[float, Dict[CartKey, Dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cart(self, user_id: int) -> Dict[CartKey, Dict]:
+        """The user's cart lines, touched for LRU and expiry. Call with the lock held."""
+        now = time.time()
+        updated, lines = self._carts.pop(user_id, (now, {}))
+        if now - updated > self.ttl:
+            lines = {}
+        self._carts[user_id] = (now, lines)
+        if len(self._carts) > self.max_users:
+            self._carts.popitem(last=False)
+        return lines
+
+    def get_lines(self, user_id: int) -> List[Dict]:
+        with self._lock:
+            return [dict(line) for line in self._cart(user_id).values()]
+
+    def set_line(self, user_id: int, item_type: str, item_id: int, quantity: int, price: float) -> None:
+        with self._lock:
+            lines = self._cart(user_id)
+            if (item_type, item_id) not in lines and len(lines) >= MAX_CART_LINES:
+                raise CartFullError()
+            lines[(item_type, item_id)] = {
+                "type": item_type, "item_id": item_id, "quantity": quantity, "price": price
+            }
+
+    def remove_line(self, user_id: int, item_type: str, item_id: int) -> bool:
+        with self._lock:
+            return self._cart(user_id).pop((item_type, item_id), None) is not None
+
+    def clear(self, user_id: int) -> None:
+        with self._lock:
+            self._carts.pop(user_id, None)
+
+
+class SharedCartStore:
+    """Carts in the host-local shared store, so every worker sees the same cart."""
+
+    def __init__(self, store: SharedStore, ttl: int = CART_TTL_SECONDS):
+        self.store = store
+        self.ttl = ttl
+        self.store.connection().execute(
+            'CREATE TABLE IF NOT EXISTS cart_line '
+            '(user_id INTEGER NOT NULL, type TEXT NOT NULL, item_id INTEGER NOT NULL, '
+            'quantity INTEGER NOT NULL, price REAL NOT NULL, updated REAL NOT NULL, '
+            'PRIMARY KEY (user_id, type, item_id))'
+        )
+
+    def get_lines(self, user_id: int) -> List[Dict]:
+        rows = self.store.connection().execute(
+            'SELECT type, item_id, quantity, price FROM cart_line '
+            'WHERE user_id = ? AND updated > ? ORDER BY rowid',
+            (user_id, time.time() - self.ttl)
+        ).fetchall()
+        return [{"type": item_type, "item_id": item_id, "quantity": quantity, "price": price}
+                for item_type, item_id, quantity, price in rows]
+
+    def set_line(self, user_id: int, item_type: str, item_id: int, quantity: int, price: float) -> None:
+        now = time.time()
+        with self.store.transaction() as conn:
+            conn.execute('DELETE FROM cart_line WHERE updated <= ?', (now - self.ttl,))
+            exists = conn.execute(
+                'SELECT 1 FROM cart_line WHERE user_id = ? AND type = ? AND item_id = ?',
+                (user_id, item_type, item_id)
+            ).fetchone()
+            if exists is None:
+                (count,) = conn.execute(
+                    'SELECT COUNT(*) FROM cart_line WHERE user_id = ?', (user_id,)
+                ).fetchone()
+                if count >= MAX_CART_LINES:
+                    raise CartFullError()
+            conn.execute(
+                'INSERT INTO cart_line (user_id, type, item_id, quantity, price, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (user_id, type, item_id) '
+                'DO UPDATE SET quantity = excluded.quantity, price = excluded.price',
+                (user_id, item_type, item_id, quantity, price, now)
+            )
+            # Touching one line keeps the whole cart alive
+            conn.execute('UPDATE cart_line SET updated = ? WHERE user_id = ?', (now, user_id))
+
+    def remove_line(self, user_id: int, item_type: str, item_id: int) -> bool:
+        with self.store.transaction() as conn:
+            cursor = conn.execute(
+                'DELETE FROM cart_line WHERE user_id = ? AND type = ? AND item_id = ?',
+                (user_id, item_type, item_id)
+            )
+            return cursor.rowcount > 0
+
+    def clear(self, user_id: int) -> None:
+        with self.store.transaction() as conn:
+            conn.execute('DELETE FROM cart_line WHERE user_id = ?', (user_id,))
+
+
+_cart_store = None
+_cart_store_lock = threading.Lock()
+
+
+def get_cart_store():
+    """The shared cart store when SHARED_STORE_PATH is set, otherwise an in-process one."""
+    global _cart_store
+    with _cart_store_lock:
+        if _cart_store is None:
+            shared_store = get_shared_store()
+            _cart_store = SharedCartStore(shared_store) if shared_store else MemoryCartStore()
+    return _cart_store
@@ -0,0 +1,347 @@
+import logging
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+from datamanager.database import SessionLocal
+
+CATALOG_SNAPSHOT = os.environ.get('CATALOG_SNAPSHOT', '0') == '1'
+CATALOG_REFRESH_SECONDS = float(os.environ.get('CATALOG_REFRESH_SECONDS', 1))
+# Safety net: rebuild from scratch now and then in case a change was missed
+CATALOG_FULL_RELOAD_SECONDS = float(os.environ.get('CATALOG_FULL_RELOAD_SECONDS', 3600))
+# Change ids are handed out before commit, so recent ones can appear late;
+# this many ids below the highest seen are re-read on every refresh
+CATALOG_CHANGE_LOOKBACK = 1000
+# Rows kept in the change log when it is pruned
+CATALOG_CHANGE_KEEP = 10_000
+CATALOG_PRUNE_SECONDS = 60
+
+ARTIST = 'artist'
+ALBUM = 'album'
+TRACK = 'track'
+
+logger = logging.getLogger("harmonapp.catalog")
+
+
+def record_catalog_change(db: Session, entity: str, entity_id: int) -> None:
+    """Log a write to an artist, album or track. The caller commits."""
+    db.add(models.CatalogChange(entity=entity, entity_id=entity_id))
+
+
+class _Row:
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+
+class ArtistRow(_Row):
+    __slots__ = ('id', 'name', 'genre')
+    MODEL = models.Artist
+
+
+class AlbumRow(_Row):
+    __slots__ = ('id', 'artist_id', 'name', 'release_date', 'price')
+    MODEL = models.Album
+
+
+class TrackRow(_Row):
+    __slots__ = ('id', 'artist_id', 'album_id', 'name', 'release_date', 'price', 'path')
+    MODEL = models.Track
+
+
+def _load_rows(db: Session, row_class, ids: Optional[Iterable[int]] = None) -> List[_Row]:
+    columns = [getattr(row_class.MODEL, name) for name in row_class.__slots__]
+    query = db.query(*columns)
+    if ids is not None:
+        query = query.filter(row_class.MODEL.id.in_(list(ids)))
+    return [row_class(*values) for values in query]
+
+
+def _sorted_remove(ids: array, value: int) -> None:
+    index = bisect_left(ids, value)
+    if index < len(ids) and ids[index] == value:
+        del ids[index]
+
+
+def _sorted_add(ids: array, value: int) -> None:
+    index = bisect_left(ids, value)
+    if index == len(ids) or ids[index] != value:
+        ids.insert(index, value)
+
+
+def _index_remove(index: Dict[int, array], key: int, value: int) -> None:
+    ids = index.get(key)
+    if ids is not None:
+        _sorted_remove(ids, value)
+        if not ids:
+            del index[key]
+
+
+class CatalogSnapshot:
+    """
+    Read-only copy of the artist, album and track tables held in each worker.
+
+    Rows are kept in __slots__ objects keyed by id, with sorted id arrays for
+    paging and album->tracks / artist->albums / artist->tracks indexes. A
+    background thread replays the catalog_change log every
+    CATALOG_REFRESH_SECONDS, reloading only the rows that changed.
+    """
+
+    def __init__(self, interval: float = CATALOG_REFRESH_SECONDS):
+        self.interval = interval
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._reset()
+        self.ready = False
+        # Bumped by this worker's catalog writes; the snapshot is only served
+        # once a refresh that started after the latest bump has finished
+        self._write_version = 0
+        self._synced_version = 0
+        self.refreshes = 0
+        self.full_reloads = 0
+
+    def _reset(self) -> None:
+        self._artists: Dict[int, ArtistRow] = {}
+        self._albums: Dict[int, AlbumRow] = {}
+        self._tracks: Dict[int, TrackRow] = {}
+        self._album_ids = array('q')
+        self._track_ids = array('q')
+        self._album_tracks: Dict[int, array] = defaultdict(lambda: array('q'))
+        self._artist_albums: Dict[int, array] = defaultdict(lambda: array('q'))
+        self._artist_tracks: Dict[int, array] = defaultdict(lambda: array('q'))
+        self._max_change_id = 0
+        self._applied: Set[int] = set()
+        self._loaded_at = 0.0
+        self._pruned_at = 0.0
+
+    # Reads
+
+    def get_artist(self, artist_id: int) -> Optional[ArtistRow]:
+        return self._artists.get(artist_id)
+
+    def get_album(self, album_id: int) -> Optional[AlbumRow]:
+        return self._albums.get(album_id)
+
+    def get_track(self, track_id: int) -> Optional[TrackRow]:
+        return self._tracks.get(track_id)
+
+    def list_albums(self, skip: int, limit: int) -> List[AlbumRow]:
+        with self._lock:
+            return [self._albums[album_id] for album_id in self._album_ids[skip:skip + limit]]
+
+    def list_tracks(self, skip: int, limit: int) -> List[TrackRow]:
+        with self._lock:
+            return [self._tracks[track_id] for track_id in self._track_ids[skip:skip + limit]]
+
+    def count_albums(self) -> int:
+        return len(self._album_ids)
+
+    def count_tracks(self, album_id: Optional[int] = None) -> int:
+        if album_id is None:
+            return len(self._track_ids)
+        return len(self._album_tracks.get(album_id, ()))
+
+    def album_tracks(self, album_id: int) -> List[TrackRow]:
+        with self._lock:
+            return [self._tracks[track_id] for track_id in self._album_tracks.get(album_id, ())]
+
+    def artist_albums(self, artist_id: int) -> List[AlbumRow]:
+        with self._lock:
+            return [self._albums[album_id] for album_id in self._artist_albums.get(artist_id, ())]
+
+    # Maintenance, called with the lock held
+
+    def _put_artist(self, row: ArtistRow) -> None:
+        self._artists[row.id] = row
+
+    def _put_album(self, row: AlbumRow) -> None:
+        old = self._albums.get(row.id)
+        if old is not None and old.artist_id != row.artist_id:
+            _index_remove(self._artist_albums, old.artist_id, row.id)
+        self._albums[row.id] = row
+        _sorted_add(self._album_ids, row.id)
+        _sorted_add(self._artist_albums[row.artist_id], row.id)
+
+    def _put_track(self, row: TrackRow) -> None:
+        old = self._tracks.get(row.id)
+        if old is not None:
+            if old.album_id != row.album_id:
+                _index_remove(self._album_tracks, old.album_id, row.id)
+            if old.artist_id != row.artist_id:
+                _index_remove(self._artist_tracks, old.artist_id, row.id)
+        self._tracks[row.id] = row
+        _sorted_add(self._track_ids, row.id)
+        _sorted_add(self._album_tracks[row.album_id], row.id)
+        _sorted_add(self._artist_tracks[row.artist_id], row.id)
+
+    def _drop_track(self, track_id: int) -> None:
+        row = self._tracks.pop(track_id, None)
+        if row is None:
+            return
+        _sorted_remove(self._track_ids, track_id)
+        _index_remove(self._album_tracks, row.album_id, track_id)
+        _index_remove(self._artist_tracks, row.artist_id, track_id)
+
+    def _drop_album(self, album_id: int) -> None:
+        # The database removed the album's tracks with it (ON DELETE CASCADE)
+        for track_id in list(self._album_tracks.pop(album_id, ())):
+            self._drop_track(track_id)
+        row = self._albums.pop(album_id, None)
+        if row is None:
+            return
+        _sorted_remove(self._album_ids, album_id)
+        _index_remove(self._artist_albums, row.artist_id, album_id)
+
+    def _drop_artist(self, artist_id: int) -> None:
+        for album_id in list(self._artist_albums.pop(artist_id, ())):
+            self._drop_album(album_id)
+        for track_id in list(self._artist_tracks.pop(artist_id, ())):
+            self._drop_track(track_id)
+        self._artists.pop(artist_id, None)
+
+    # Refresh
+
+    def full_reload(self, db: Session) -> None:
+        max_change_id = db.query(func.max(models.CatalogChange.id)).scalar() or 0
+        artists = _load_rows(db, ArtistRow)
+        albums = _load_rows(db, AlbumRow)
+        tracks = _load_rows(db, TrackRow)
+        with self._lock:
+            self._reset()
+            for row in artists:
+                self._put_artist(row)
+            for row in sorted(albums, key=lambda album: album.id):
+                self._put_album(row)
+            for row in sorted(tracks, key=lambda track: track.id):
+                self._put_track(row)
+            # Changes up to here are reflected in the rows just read, but may
+            # still be re-read from the lookback window; replaying them is harmless
+            self._max_change_id = max_change_id
+            self._loaded_at = time.monotonic()
+            self.ready = True
+        self.full_reloads += 1
+
+    def apply_changes(self, db: Session) -> int:
+        """Reload the rows named by changes not applied yet. Returns the number of changes."""
+        since = max(0, self._max_change_id - CATALOG_CHANGE_LOOKBACK)
+        changes = [(change_id, entity, entity_id) for change_id, entity, entity_id in
+                   db.query(models.CatalogChange.id,
+                            models.CatalogChange.entity,
+                            models.CatalogChange.entity_id)
+                   .filter(models.CatalogChange.id > since)
+                   .order_by(models.CatalogChange.id)
+                   if change_id not in self._applied]
+        if not changes:
+            return 0
+
+        changed = defaultdict(set)
+        for _, entity, entity_id in changes:
+            changed[entity].add(entity_id)
+        loaded = {
+            ARTIST: {row.id: row for row in _load_rows(db, ArtistRow, changed[ARTIST])} if changed[ARTIST] else {},
+            ALBUM: {row.id: row for row in _load_rows(db, AlbumRow, changed[ALBUM])} if changed[ALBUM] else {},
+            TRACK: {row.id: row for row in _load_rows(db, TrackRow, changed[TRACK])} if changed[TRACK] else {},
+        }
+
+        with self._lock:
+            for entity, put, drop in ((ARTIST, self._put_artist, self._drop_artist),
+                                      (ALBUM, self._put_album, self._drop_album),
+                                      (TRACK, self._put_track, self._drop_track)):
+                for entity_id in changed[entity]:
+                    row = loaded[entity].get(entity_id)
+                    if row is None:
+                        drop(entity_id)
+                    else:
+                        put(row)
+            self._max_change_id = max(self._max_change_id, changes[-1][0])
+            self._applied.update(change_id for change_id, _, _ in changes)
+            floor = self._max_change_id - CATALOG_CHANGE_LOOKBACK
+            self._applied = {change_id for change_id in self._applied if change_id > floor}
+        return len(changes)
+
+    def prune_changes(self, db: Session) -> None:
+        """Trim the shared change log; every worker may do this, the result is the same."""
+        max_change_id = db.query(func.max(models.CatalogChange.id)).scalar() or 0
+        (db.query(models.CatalogChange)
+         .filter(models.CatalogChange.id <= max_change_id - CATALOG_CHANGE_KEEP)
+         .delete(synchronize_session=False))
+        db.commit()
+
+    def refresh(self) -> None:
+        # Read before querying, so every write counted here is already committed
+        target_version = self._write_version
+        db = SessionLocal()
+        try:
+            now = time.monotonic()
+            if not self.ready or now - self._loaded_at > CATALOG_FULL_RELOAD_SECONDS:
+                self.full_reload(db)
+            else:
+                self.apply_changes(db)
+            self._synced_version = max(self._synced_version, target_version)
+            if now - self._pruned_at > CATALOG_PRUNE_SECONDS:
+                self.prune_changes(db)
+                self._pruned_at = now
+            self.refreshes += 1
+        except Exception:
+            db.rollback()
+            logger.exception("catalog snapshot refresh failed")
+        finally:
+            db.close()
+
+    def request_refresh(self) -> None:
+        """
+        Call after committing a catalog write. Reads in this worker go to the
+        database until the refresher has caught up with the write.
+        """
+        with self._lock:
+            self._write_version += 1
+        self._wake.set()
+
+    @property
+    def current(self) -> bool:
+        return self.ready and self._synced_version >= self._write_version
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.refresh()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self.refresh()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="catalog-snapshot", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+
+
+catalog_snapshot = CatalogSnapshot()
+
+
+def snapshot_if_ready() -> Optional[CatalogSnapshot]:
+    """
+    The catalog snapshot when it is enabled, loaded and includes this worker's
+    own writes, else None to fall back to the database.
+    """
+    if CATALOG_SNAPSHOT and catalog_snapshot.current:
+        return catalog_snapshot
+    return None
@@ -0,0 +1,81 @@
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+from fastapi import HTTPException, Query, status
+from sqlalchemy.orm import Query as SQLQuery
+
+import models
+
+# Each of these is backed by an index on track and album (see models.py)
+CATALOG_SORT_COLUMNS = ("id", "name", "release_date", "price")
+
+
+@dataclass(frozen=True)
+class CatalogFilters:
+    """Validated filters and sort order for the track and album list routes."""
+    artist_id: Optional[int] = None
+    genre: Optional[str] = None
+    released_after: Optional[date] = None
+    released_before: Optional[date] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    sort: Optional[str] = None
+
+    def is_default(self) -> bool:
+        return self == CatalogFilters()
+
+    def apply(self, query: SQLQuery, model) -> SQLQuery:
+        if self.artist_id is not None:
+            query = query.filter(model.artist_id == self.artist_id)
+        if self.genre is not None:
+            query = (query.join(models.Artist, models.Artist.id == model.artist_id)
+                     .filter(models.Artist.genre == self.genre))
+        if self.released_after is not None:
+            query = query.filter(model.release_date >= self.released_after)
+        if self.released_before is not None:
+            query = query.filter(model.release_date <= self.released_before)
+        if self.min_price is not None:
+            query = query.filter(model.price >= self.min_price)
+        if self.max_price is not None:
+            query = query.filter(model.price <= self.max_price)
+
+        # id breaks ties so pages don't overlap
+        sort = self.sort or "id"
+        descending = sort.startswith("-")
+        column = getattr(model, sort.lstrip("-"))
+        if column is model.id:
+            return query.order_by(column.desc() if descending else column)
+        if descending:
+            return query.order_by(column.desc(), model.id.desc())
+        return query.order_by(column, model.id)
+
+
+def catalog_filters(
+        artist_id: Optional[int] = None,
+        genre: Optional[str] = None,
+        released_after: Optional[date] = Query(None, description="Released on or after this date"),
+        released_before: Optional[date] = Query(None, description="Released on or before this date"),
+        min_price: Optional[float] = Query(None, ge=0),
+        max_price: Optional[float] = Query(None, ge=0),
+        sort: Optional[str] = Query(
+            None,
+            description=f"One of {', '.join(CATALOG_SORT_COLUMNS)}; prefix with - for descending"
+        )
+) -> CatalogFilters:
+    if sort is not None and sort.lstrip("-") not in CATALOG_SORT_COLUMNS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown sort column: {sort.lstrip('-')}"
+        )
+    if released_after and released_before and released_after > released_before:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="released_after must not be later than released_before"
+        )
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="min_price must not be greater than max_price"
+        )
+    return CatalogFilters(artist_id, genre, released_after, released_before, min_price, max_price, sort)
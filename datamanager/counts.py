@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from fastapi import Response
+from sqlalchemy import Table, func, inspect, select, text
+from sqlalchemy.orm import Query, Session
+
+from datamanager.database import SessionLocal
+
+# Lists with up to this many rows get an exact count
+TOTAL_COUNT_EXACT_LIMIT = int(os.environ.get('TOTAL_COUNT_EXACT_LIMIT', 10_000))
+# Age after which a cached count is refreshed in the background
+COUNT_CACHE_SECONDS = float(os.environ.get('COUNT_CACHE_SECONDS', 60))
+COUNT_CACHE_MAX_KEYS = 1000
+
+logger = logging.getLogger("harmonapp.counts")
+
+
+def _key_only(query: Query) -> Query:
+    """The query reduced to its entity's primary key, so counting doesn't read other columns."""
+    entity = query.column_descriptions[0]["entity"]
+    return query.order_by(None).with_entities(*inspect(entity).primary_key)
+
+
+def _count_statement(query: Query):
+    return select(func.count()).select_from(_key_only(query).subquery())
+
+
+def _whole_table(query: Query) -> Optional[Table]:
+    """The table when the query reads all of one table, else None."""
+    statement = query.statement
+    froms = statement.get_final_froms()
+    if statement.whereclause is None and len(froms) == 1 and isinstance(froms[0], Table):
+        return froms[0]
+    return None
+
+
+def planner_estimate(db: Session, query: Query) -> Optional[int]:
+    """
+    PostgreSQL's row estimate: pg_class.reltuples for a whole table, the
+    planner's row count otherwise. None on other databases or before the
+    table has been analyzed.
+    """
+    if db.get_bind().dialect.name != 'postgresql':
+        return None
+
+    table = _whole_table(query)
+    if table is not None:
+        reltuples = db.execute(
+            text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:name)"),
+            {"name": table.name}
+        ).scalar()
+        return int(reltuples) if reltuples is not None and reltuples >= 0 else None
+
+    compiled = query.statement.order_by(None).compile(dialect=db.get_bind().dialect)
+    plans = db.connection().exec_driver_sql(
+        "EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params
+    ).scalar()
+    if isinstance(plans, str):
+        plans = json.loads(plans)
+    return int(plans[0]["Plan"]["Plan Rows"])
+
+
+class CountCache:
+    """
+    Exact counts for large lists, served from memory and recounted on a
+    background thread once they are older than COUNT_CACHE_SECONDS.
+    """
+
+    def __init__(self, max_age: float = COUNT_CACHE_SECONDS):
+        self.max_age = max_age
+        self._counts: Dict[Tuple, Tuple[int, float]] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="count-cache")
+
+    def _recount(self, key: Tuple, statement) -> int:
+        db = SessionLocal()
+        try:
+            count = db.execute(statement).scalar()
+        finally:
+            db.close()
+        with self._lock:
+            if len(self._counts) >= COUNT_CACHE_MAX_KEYS and key not in self._counts:
+                self._counts.clear()
+            self._counts[key] = (count, time.monotonic())
+        return count
+
+    def _background_recount(self, key: Tuple, statement) -> None:
+        try:
+            self._recount(key, statement)
+        except Exception:
+            logger.exception("background count failed")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, query: Query) -> int:
+        statement = _count_statement(query)
+        compiled = statement.compile()
+        key = (str(compiled), tuple(sorted((name, repr(value)) for name, value in compiled.params.items())))
+        with self._lock:
+            cached = self._counts.get(key)
+            stale = cached is None or time.monotonic() - cached[1] > self.max_age
+            if cached is not None and stale and key not in self._refreshing:
+                self._refreshing.add(key)
+                self._executor.submit(self._background_recount, key, statement)
+        if cached is None:
+            return self._recount(key, statement)
+        return cached[0]
+
+
+count_cache = CountCache()
+
+
+def count_total(db: Session, query: Query) -> Tuple[int, bool]:
+    """
+    Count the rows of a list query. Returns (count, exact): exact when the list
+    has at most TOTAL_COUNT_EXACT_LIMIT rows, otherwise a planner estimate on
+    PostgreSQL or a cached count elsewhere.
+    """
+    bounded = _key_only(query).limit(TOTAL_COUNT_EXACT_LIMIT + 1).subquery()
+    count = db.query(func.count()).select_from(bounded).scalar()
+    if count <= TOTAL_COUNT_EXACT_LIMIT:
+        return count, True
+
+    estimate = planner_estimate(db, query)
+    if estimate is not None:
+        return max(estimate, count), False
+    return count_cache.get(query), False
+
+
+def set_total_count(response: Response, count: int, exact: bool = True) -> None:
+    response.headers["X-Total-Count"] = str(count)
+    if not exact:
+        response.headers["X-Total-Count-Approximate"] = "true"
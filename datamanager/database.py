@@ -1,16 +1,45 @@
 import os
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, inspect
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 load_dotenv()
 SQLALCHEMY_DATABASE_URI = os.environ.get('CONNECTION_STRING')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
 
-engine = create_engine(SQLALCHEMY_DATABASE_URI)
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URI,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_pre_ping=True
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def _reset_pool_after_fork():
+    # A forked worker must not reuse the parent's sockets; drop the inherited
+    # pool without closing the connections the parent still owns
+    engine.dispose(close=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+# Dialect-specific INSERT constructs, for ON CONFLICT upserts
+DIALECT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def dialect_insert(db):
+    return DIALECT_INSERTS[db.get_bind().dialect.name]
+
+
 def get_db():
     db = SessionLocal()
     try:
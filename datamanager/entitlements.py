@@ -0,0 +1,113 @@
+from typing import List, Sequence
+
+from sqlalchemy import and_, insert, select
+from sqlalchemy.orm import Session
+
+import models
+
+ENTITLEMENT_COLUMNS = ["user_id", "track_id", "order_item_id"]
+
+
+# Only paid-for (Completed) orders entitle their user to anything
+def _track_item_source():
+    return (select(models.Order.user_id, models.Track.id, models.OrderItem.id)
+            .select_from(models.OrderItem)
+            .join(models.Order, and_(models.Order.id == models.OrderItem.order_id,
+                                     models.Order.status == "Completed"))
+            .join(models.Track, and_(models.OrderItem.type == "track",
+                                     models.Track.id == models.OrderItem.item_id)))
+
+
+def _album_item_source():
+    return (select(models.Order.user_id, models.Track.id, models.OrderItem.id)
+            .select_from(models.OrderItem)
+            .join(models.Order, and_(models.Order.id == models.OrderItem.order_id,
+                                     models.Order.status == "Completed"))
+            .join(models.Track, and_(models.OrderItem.type == "album",
+                                     models.Track.album_id == models.OrderItem.item_id)))
+
+
+def _insert_from(db: Session, source) -> None:
+    db.execute(insert(models.Entitlement).from_select(ENTITLEMENT_COLUMNS, source))
+
+
+def grant_for_order_item(db: Session, order_item_id: int) -> None:
+    """
+    Entitle the order's user to the track, or every track of the album, of an
+    order item. Does nothing unless the order is Completed.
+    """
+    _insert_from(db, _track_item_source().where(models.OrderItem.id == order_item_id))
+    _insert_from(db, _album_item_source().where(models.OrderItem.id == order_item_id))
+
+
+def revoke_for_order_item(db: Session, order_item_id: int) -> None:
+    db.query(models.Entitlement).filter(
+        models.Entitlement.order_item_id == order_item_id
+    ).delete(synchronize_session=False)
+
+
+def refresh_for_order_item(db: Session, order_item_id: int) -> None:
+    """Re-derive an order item's entitlements after its item_id or type changed."""
+    revoke_for_order_item(db, order_item_id)
+    grant_for_order_item(db, order_item_id)
+
+
+def grant_for_order(db: Session, order_id: int) -> None:
+    """Entitle the user to every item of an order, once it is Completed."""
+    _insert_from(db, _track_item_source().where(models.OrderItem.order_id == order_id))
+    _insert_from(db, _album_item_source().where(models.OrderItem.order_id == order_id))
+
+
+def revoke_for_order(db: Session, order_id: int) -> None:
+    """Remove what an order granted, when it leaves the Completed status."""
+    item_ids = select(models.OrderItem.id).where(models.OrderItem.order_id == order_id)
+    db.query(models.Entitlement).filter(
+        models.Entitlement.order_item_id.in_(item_ids)
+    ).delete(synchronize_session=False)
+
+
+def grant_for_album_track(db: Session, track_id: int) -> None:
+    """Entitle existing buyers of an album to a track that was added to it."""
+    _insert_from(db, _album_item_source().where(models.Track.id == track_id))
+
+
+def refresh_for_album_track(db: Session, track_id: int) -> None:
+    """Re-derive album-based entitlements for a track that moved to another album."""
+    album_item_ids = select(models.OrderItem.id).where(models.OrderItem.type == "album")
+    db.query(models.Entitlement).filter(
+        models.Entitlement.track_id == track_id,
+        models.Entitlement.order_item_id.in_(album_item_ids)
+    ).delete(synchronize_session=False)
+    grant_for_album_track(db, track_id)
+
+
+def owned_track_ids(db: Session, user_id: int, track_ids: Sequence[int]) -> List[int]:
+    """Return which of the given tracks the user owns, using the primary key index."""
+    if not track_ids:
+        return []
+    rows = (db.query(models.Entitlement.track_id)
+            .filter(models.Entitlement.user_id == user_id,
+                    models.Entitlement.track_id.in_(set(track_ids)))
+            .distinct()
+            .all())
+    owned = {row[0] for row in rows}
+    return [track_id for track_id in dict.fromkeys(track_ids) if track_id in owned]
+
+
+def rebuild_entitlements(db: Session) -> None:
+    """Backfill: recompute the whole entitlement table from orders and order items."""
+    db.query(models.Entitlement).delete(synchronize_session=False)
+    _insert_from(db, _track_item_source())
+    _insert_from(db, _album_item_source())
+    db.commit()
+
+
+if __name__ == "__main__":
+    from datamanager.database import SessionLocal, engine
+
+    models.Base.metadata.create_all(bind=engine, tables=[models.Entitlement.__table__])
+    session = SessionLocal()
+    try:
+        rebuild_entitlements(session)
+    finally:
+        session.close()
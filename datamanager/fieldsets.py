@@ -0,0 +1,64 @@
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple, Type
+
+from fastapi import HTTPException, Query, Response, status
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ConfigDict, create_model
+from sqlalchemy.orm import load_only
+
+
+@lru_cache(maxsize=None)
+def trimmed_model(schema: Type[BaseModel], fields: Tuple[str, ...]) -> Type[BaseModel]:
+    """A copy of `schema` with only `fields`, built once per combination."""
+    return create_model(
+        f"{schema.__name__}Fields",
+        __config__=ConfigDict(from_attributes=True),
+        **{name: (schema.model_fields[name].annotation, ...) for name in fields}
+    )
+
+
+class Fieldset:
+    """A validated ?fields= selection for one response schema."""
+
+    def __init__(self, schema: Type[BaseModel], fields: Tuple[str, ...]):
+        self.fields = fields
+        self.model = trimmed_model(schema, fields)
+
+    def load_only(self, model):
+        """Query option that selects only the requested columns (plus the primary key)."""
+        return load_only(*(getattr(model, name) for name in self.fields))
+
+    def response(self, rows: Sequence, response: Response) -> JSONResponse:
+        # Returned directly, so headers set on the injected response are carried over
+        return JSONResponse(
+            [self.model.model_validate(row).model_dump(mode="json") for row in rows],
+            headers=dict(response.headers)
+        )
+
+
+def fieldset_param(schema: Type[BaseModel]):
+    """Dependency that parses ?fields= against `schema`'s fields."""
+    allowed = tuple(schema.model_fields)
+
+    def parse_fields(
+            fields: Optional[str] = Query(None, description=f"Comma separated subset of: {', '.join(allowed)}")
+    ) -> Optional[Fieldset]:
+        if fields is None:
+            return None
+        requested = tuple(dict.fromkeys(part.strip() for part in fields.split(",") if part.strip()))
+        unknown = [name for name in requested if name not in allowed]
+        if unknown or not requested:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown field(s): {', '.join(unknown)}" if unknown else "No fields requested"
+            )
+        return Fieldset(schema, requested)
+
+    return parse_fields
+
+
+def project(rows: Sequence, fieldset: Optional[Fieldset], response: Response):
+    """The rows as-is for the route's response model, or trimmed to the requested fields."""
+    if fieldset is None:
+        return rows
+    return fieldset.response(rows, response)
@@ -0,0 +1,108 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+import models
+from datamanager.entitlements import grant_for_order
+from datamanager.sales import apply_order_sales
+
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+JOB_BACKOFF_SECONDS = float(os.environ.get('JOB_BACKOFF_SECONDS', 2))
+# A running job whose worker died is handed out again after this long
+JOB_LOCK_TIMEOUT_SECONDS = int(os.environ.get('JOB_LOCK_TIMEOUT_SECONDS', 300))
+
+PROCESS_ORDER = 'process_order'
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def enqueue(db: Session, kind: str, order_id: int) -> models.Job:
+    """Add a job to the queue. The caller commits."""
+    job = models.Job(kind=kind, order_id=order_id, status='queued', attempts=0, run_at=utcnow())
+    db.add(job)
+    return job
+
+
+def claim_batch(db: Session, batch_size: int) -> List[models.Job]:
+    """
+    Claim up to batch_size due jobs. On PostgreSQL, FOR UPDATE SKIP LOCKED lets
+    several workers claim concurrently without blocking on each other; SQLite
+    ignores the locking clause and relies on its single-writer lock instead.
+    """
+    now = utcnow()
+    stale_before = now - timedelta(seconds=JOB_LOCK_TIMEOUT_SECONDS)
+    jobs = (
+        db.query(models.Job)
+        .filter(or_(
+            and_(models.Job.status == 'queued', models.Job.run_at <= now),
+            and_(models.Job.status == 'running', models.Job.locked_at < stale_before)
+        ))
+        .order_by(models.Job.run_at, models.Job.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for job in jobs:
+        job.status = 'running'
+        job.locked_at = now
+        job.attempts += 1
+    db.commit()
+    return jobs
+
+
+def complete(db: Session, job: models.Job) -> None:
+    job.status = 'done'
+    job.locked_at = None
+    job.last_error = None
+    db.commit()
+
+
+def fail(db: Session, job: models.Job, error: Exception) -> None:
+    """Reschedule with exponential backoff, or give up after JOB_MAX_ATTEMPTS."""
+    job.last_error = repr(error)[:1000]
+    job.locked_at = None
+    if job.attempts >= JOB_MAX_ATTEMPTS:
+        job.status = 'failed'
+    else:
+        job.status = 'queued'
+        job.run_at = utcnow() + timedelta(seconds=JOB_BACKOFF_SECONDS * 2 ** (job.attempts - 1))
+    db.commit()
+
+
+def process_order(db: Session, order_id: int) -> None:
+    """Post-purchase steps for a checked-out order."""
+    order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    if order is None or order.status != 'Processing':
+        return
+
+    # Settle the total from the items as they are at checkout time
+    subtotals = (db.query(models.OrderItem.subtotal)
+                 .filter(models.OrderItem.order_id == order_id)
+                 .all())
+    order.total = sum(subtotal[0] or 0.0 for subtotal in subtotals)
+    order.status = 'Completed'
+    db.flush()
+
+    # Ownership and artist revenue start with the completed payment
+    grant_for_order(db, order_id)
+    apply_order_sales(db, order_id)
+
+
+JOB_HANDLERS: Dict[str, Callable[[Session, int], None]] = {
+    PROCESS_ORDER: process_order,
+}
+
+
+def run_job(db: Session, job: models.Job) -> None:
+    try:
+        JOB_HANDLERS[job.kind](db, job.order_id)
+    except Exception as error:
+        db.rollback()
+        fail(db, job, error)
+    else:
+        complete(db, job)
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+PEAKS_CACHE_DIR = os.environ.get('PEAKS_CACHE_DIR', '.peaks_cache')
+PEAKS_WORKERS = int(os.environ.get('PEAKS_WORKERS', 2))
+DEFAULT_BUCKETS = 512
+MAX_BUCKETS = 2048
+HASH_CHUNK_SIZE = 1024 * 1024
+# Content hashes remembered per worker
+HASH_CACHE_SIZE = 4096
+
+# WAV sample width in bytes -> numpy dtype
+SAMPLE_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+_executor: Optional[ProcessPoolExecutor] = None
+# (path, size, mtime) -> content hash, so unchanged files are not re-hashed
+_hash_by_stat: "OrderedDict[Tuple[str, int, float], str]" = OrderedDict()
+# Route handlers read and evict from threadpool threads
+_hash_lock = threading.Lock()
+
+
+class UnsupportedAudioError(ValueError):
+    pass
+
+
+class MalformedAudioError(UnsupportedAudioError):
+    """A WAV file whose headers are truncated or inconsistent."""
+
+
+def file_content_hash(path: str) -> str:
+    stat = os.stat(path)
+    stat_key = (path, stat.st_size, stat.st_mtime)
+    with _hash_lock:
+        content_hash = _hash_by_stat.get(stat_key)
+        if content_hash is not None:
+            _hash_by_stat.move_to_end(stat_key)
+            return content_hash
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as audio_file:
+        for chunk in iter(lambda: audio_file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+    with _hash_lock:
+        _hash_by_stat[stat_key] = content_hash
+        if len(_hash_by_stat) > HASH_CACHE_SIZE:
+            _hash_by_stat.popitem(last=False)
+    return content_hash
+
+
+def _read_wav_layout(path: str) -> Tuple[int, int, int, int]:
+    """Return (channels, sample_width, data_offset, data_size) of a PCM WAV file."""
+    with open(path, 'rb') as wav_file:
+        header = wav_file.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:] != b'WAVE':
+            raise UnsupportedAudioError("Only WAV files are supported")
+
+        channels = sample_width = None
+        while True:
+            header = wav_file.read(8)
+            if len(header) < 8:
+                raise MalformedAudioError("WAV file has no data chunk")
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = wav_file.read(chunk_size)
+                if len(fmt) < 16:
+                    raise MalformedAudioError("WAV fmt chunk is truncated")
+                audio_format, channels, _, _, _, bits = struct.unpack('<HHIIHH', fmt[:16])
+                if audio_format not in (1, 0xFFFE):
+                    raise UnsupportedAudioError("Only PCM WAV files are supported")
+                sample_width = bits // 8
+                if channels == 0 or sample_width == 0:
+                    raise MalformedAudioError("WAV fmt chunk is invalid")
+            elif chunk_id == b'data':
+                if channels is None:
+                    raise MalformedAudioError("WAV data chunk precedes fmt chunk")
+                return channels, sample_width, wav_file.tell(), chunk_size
+            else:
+                wav_file.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+
+def compute_peaks(path: str, buckets: int) -> Dict[str, list]:
+    """
+    Min/max amplitude per bucket, normalized to [-1, 1], computed over a
+    memory-mapped view of the PCM data so the file is never loaded whole.
+    """
+    channels, sample_width, offset, size = _read_wav_layout(path)
+    dtype = SAMPLE_DTYPES.get(sample_width)
+    if dtype is None:
+        raise UnsupportedAudioError(f"Unsupported WAV sample width: {sample_width * 8} bits")
+
+    # Truncated files and streamed WAVs (size 0xFFFFFFFF) claim more data than
+    # the file holds, so only the frames actually present are mapped
+    frame_bytes = sample_width * channels
+    frames = min(size, os.path.getsize(path) - offset) // frame_bytes
+    if frames == 0:
+        return {"min": [0.0] * buckets, "max": [0.0] * buckets}
+
+    samples = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(frames, channels))
+    buckets = min(buckets, frames)
+    edges = np.linspace(0, frames, buckets + 1, dtype=np.int64)[:-1]
+
+    mins = np.minimum.reduceat(samples, edges, axis=0).min(axis=1).astype(np.float64)
+    maxs = np.maximum.reduceat(samples, edges, axis=0).max(axis=1).astype(np.float64)
+
+    if dtype is np.uint8:
+        mins -= 128
+        maxs -= 128
+        full_scale = 128.0
+    else:
+        full_scale = float(np.iinfo(dtype).max) + 1
+
+    return {
+        "min": np.round(mins / full_scale, 3).tolist(),
+        "max": np.round(maxs / full_scale, 3).tolist(),
+    }
+
+
+def _cache_path(content_hash: str, buckets: int) -> str:
+    return os.path.join(PEAKS_CACHE_DIR, f"{content_hash}_{buckets}.json")
+
+
+def get_peaks(path: str, buckets: int = DEFAULT_BUCKETS) -> Dict[str, list]:
+    """Return peaks from the on-disk cache, computing and storing them on a miss."""
+    cache_path = _cache_path(file_content_hash(path), buckets)
+    if os.path.exists(cache_path):
+        with open(cache_path) as cache_file:
+            return json.load(cache_file)
+
+    peaks = compute_peaks(path, buckets)
+    os.makedirs(PEAKS_CACHE_DIR, exist_ok=True)
+    # Write then rename so concurrent readers never see a partial file
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as cache_file:
+        json.dump(peaks, cache_file)
+    os.replace(temp_path, cache_path)
+    return peaks
+
+
+def _precompute(path: str, buckets: int) -> None:
+    try:
+        get_peaks(path, buckets)
+    except (OSError, UnsupportedAudioError):
+        pass
+
+
+def schedule_peaks(path: str, buckets: int = DEFAULT_BUCKETS) -> None:
+    """Compute a track's default peaks in the background process pool."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PEAKS_WORKERS)
+    _executor.submit(_precompute, path, buckets)
+
+
+def shutdown_peaks_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
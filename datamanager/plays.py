@@ -0,0 +1,144 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+import models
+from datamanager.database import SessionLocal, dialect_insert
+
+PLAY_BUFFER_SIZE = int(os.environ.get('PLAY_BUFFER_SIZE', 1000))
+PLAY_FLUSH_INTERVAL = float(os.environ.get('PLAY_FLUSH_INTERVAL', 2))
+# Plays kept across failed flushes before the oldest are dropped
+PLAY_BUFFER_MAX_BACKLOG = PLAY_BUFFER_SIZE * 10
+
+logger = logging.getLogger("harmonapp.plays")
+
+
+class PlayBuffer:
+    """
+    In-process buffer for play events. Plays are appended in memory and
+    written to the database in bulk when the buffer reaches PLAY_BUFFER_SIZE
+    or every PLAY_FLUSH_INTERVAL seconds, whichever comes first, with the
+    per-track counters aggregated before they are written.
+    """
+
+    def __init__(self, max_size: int = PLAY_BUFFER_SIZE, interval: float = PLAY_FLUSH_INTERVAL):
+        self.max_size = max_size
+        self.interval = interval
+        self._rows: List[Dict] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+
+    def add(self, user_id: int, track_id: int, played_at: datetime) -> None:
+        with self._lock:
+            self._rows.append({"user_id": user_id, "track_id": track_id, "played_at": played_at})
+            full = len(self._rows) >= self.max_size
+        if full:
+            self._wake.set()
+
+    def pending_for_user(self, user_id: int) -> List[Dict]:
+        with self._lock:
+            return [row for row in self._rows if row["user_id"] == user_id]
+
+    def depth(self) -> int:
+        return len(self._rows)
+
+    def flush(self) -> int:
+        """Write everything buffered so far. Returns the number of plays written."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+
+            started = time.perf_counter()
+            db = SessionLocal()
+            try:
+                written = write_plays(db, rows)
+            except Exception:
+                db.rollback()
+                self.failed_flushes += 1
+                logger.exception("play flush failed, %s plays re-queued", len(rows))
+                with self._lock:
+                    self._rows = (rows + self._rows)[-PLAY_BUFFER_MAX_BACKLOG:]
+                return 0
+            finally:
+                db.close()
+
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.flushed_rows += written
+            return written
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="play-buffer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the flusher and write whatever is still buffered."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def metrics(self) -> Dict:
+        return {
+            "depth": self.depth(),
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
+
+
+def write_plays(db: Session, rows: List[Dict]) -> int:
+    """Bulk insert plays and add them to the per-track counters in one transaction."""
+    # Drop plays whose track or user was deleted, so one bad row can't fail the batch
+    track_ids = {row["track_id"] for row in rows}
+    user_ids = {row["user_id"] for row in rows}
+    existing_tracks = {track_id for (track_id,) in
+                       db.query(models.Track.id).filter(models.Track.id.in_(track_ids)).all()}
+    existing_users = {user_id for (user_id,) in
+                      db.query(models.User.id).filter(models.User.id.in_(user_ids)).all()}
+    rows = [row for row in rows
+            if row["track_id"] in existing_tracks and row["user_id"] in existing_users]
+    if not rows:
+        return 0
+
+    db.execute(insert(models.Play), rows)
+
+    counts = Counter(row["track_id"] for row in rows)
+    stmt = dialect_insert(db)(models.TrackPlayCount.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["track_id"],
+        set_={"plays": models.TrackPlayCount.__table__.c.plays + stmt.excluded.plays}
+    )
+    db.execute(stmt, [{"track_id": track_id, "plays": plays} for track_id, plays in counts.items()])
+    db.commit()
+    return len(rows)
+
+
+play_buffer = PlayBuffer()
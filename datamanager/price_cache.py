@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import literal, select, union_all
+from sqlalchemy.orm import Session
+
+import models
+
+PRICE_CACHE_SIZE = int(os.environ.get('PRICE_CACHE_SIZE', 10_000))
+# Bounds how long another worker's price change can go unseen; invalidation is per process
+PRICE_CACHE_TTL_SECONDS = float(os.environ.get('PRICE_CACHE_TTL_SECONDS', 30))
+
+PriceKey = Tuple[str, int]
+
+
+def load_item_prices(db: Session, items: Iterable[PriceKey]) -> Dict[PriceKey, Optional[float]]:
+    """
+    Read the prices of many (type, item_id) pairs with a single query.
+    Items that don't exist map to None.
+    """
+    items = set(items)
+    track_ids = [item_id for item_type, item_id in items if item_type == "track"]
+    album_ids = [item_id for item_type, item_id in items if item_type == "album"]
+    selects = []
+    if track_ids:
+        selects.append(select(literal("track"), models.Track.id, models.Track.price)
+                       .where(models.Track.id.in_(track_ids)))
+    if album_ids:
+        selects.append(select(literal("album"), models.Album.id, models.Album.price)
+                       .where(models.Album.id.in_(album_ids)))
+
+    prices = dict.fromkeys(items)
+    if selects:
+        for item_type, item_id, price in db.execute(union_all(*selects)):
+            prices[(item_type, item_id)] = price
+    return prices
+
+
+class PriceCache:
+    """
+    Bounded LRU cache of item prices keyed by (type, item_id), filled in
+    bulk from the database and invalidated by the track/album write routes.
+    """
+
+    def __init__(self, max_size: int = PRICE_CACHE_SIZE, ttl: float = PRICE_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._prices: "OrderedDict[PriceKey, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a load that raced a write isn't cached
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, db: Session, items: Iterable[PriceKey]) -> Dict[PriceKey, Optional[float]]:
+        prices = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for key in set(items):
+                entry = self._prices.get(key)
+                if entry is not None and now - entry[1] < self.ttl:
+                    self._prices.move_to_end(key)
+                    prices[key] = entry[0]
+                else:
+                    missing.append(key)
+            self.hits += len(prices)
+            self.misses += len(missing)
+            version = self._version
+        if not missing:
+            return prices
+
+        loaded = load_item_prices(db, missing)
+        prices.update(loaded)
+        with self._lock:
+            if version == self._version:
+                for key, price in loaded.items():
+                    if price is not None:
+                        self._prices[key] = (price, now)
+                        self._prices.move_to_end(key)
+                while len(self._prices) > self.max_size:
+                    self._prices.popitem(last=False)
+        return prices
+
+    def invalidate(self, item_type: str, item_id: int) -> None:
+        self.invalidate_many([(item_type, item_id)])
+
+    def invalidate_many(self, items: Iterable[PriceKey]) -> None:
+        with self._lock:
+            self._version += 1
+            for key in items:
+                self._prices.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._prices.clear()
+
+
+price_cache = PriceCache()
@@ -0,0 +1,224 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy.orm import Session
+
+import models
+
+SIMILAR_ARTISTS_TOP_K = int(os.environ.get('SIMILAR_ARTISTS_TOP_K', 50))
+SIMILAR_ARTISTS_METRIC = os.environ.get('SIMILAR_ARTISTS_METRIC', 'cosine')
+# Full rebuild interval; also picks up follows recorded by other workers
+SIMILAR_ARTISTS_REBUILD_SECONDS = int(os.environ.get('SIMILAR_ARTISTS_REBUILD_SECONDS', 3600))
+# Pending follow deltas are folded into the sparse matrix past this count
+SIMILAR_ARTISTS_MERGE_THRESHOLD = 10000
+
+
+class CoFollowIndex:
+    """
+    Artist-artist co-follow counts built from the Follower table.
+
+    co[i, j] is the number of users following both artists i and j, and
+    degree[i] is artist i's follower count. Follow and unfollow events
+    are applied incrementally as deltas, and the top-K neighbours are cached
+    per artist until one of their counts changes.
+    """
+
+    def __init__(self, top_k: int = SIMILAR_ARTISTS_TOP_K, metric: str = SIMILAR_ARTISTS_METRIC):
+        self.top_k = top_k
+        self.metric = metric
+        self._lock = threading.Lock()
+        # Only one caller rebuilds at a time; follows recorded meanwhile are
+        # logged as (user_id, artist_id, change) and replayed onto the new matrix
+        self._rebuilding = False
+        self._pending: List[Tuple[int, int, int]] = []
+        self._reset()
+
+    def _reset(self):
+        self.artist_ids = np.empty(0, dtype=np.int64)
+        self.index_of: Dict[int, int] = {}
+        self.co = sparse.csr_matrix((0, 0), dtype=np.int32)
+        self.degree = np.empty(0, dtype=np.int64)
+        self.deltas: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.delta_count = 0
+        self.top: Dict[int, List[Tuple[int, float]]] = {}
+        self.built_at = 0.0
+        self.stale = True
+
+    def _begin_rebuild(self) -> bool:
+        with self._lock:
+            if self._rebuilding:
+                return False
+            self._rebuilding = True
+            self._pending = []
+            return True
+
+    def rebuild(self, db: Session) -> None:
+        """Build the co-follow matrix as A.T @ A over the binary user x artist matrix."""
+        if not self._begin_rebuild():
+            return
+        try:
+            self._rebuild(db)
+        except BaseException:
+            # The old matrix stays; the logged follows were never applied to it
+            with self._lock:
+                self._rebuilding = False
+                self._pending = []
+                self.stale = True
+            raise
+
+    def _rebuild(self, db: Session) -> None:
+        pairs = np.array(
+            db.query(models.Follower.user_id, models.Follower.artist_id).all(),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        artist_ids = np.array(
+            [row[0] for row in db.query(models.Artist.id).order_by(models.Artist.id).all()],
+            dtype=np.int64
+        )
+
+        user_ids, user_cols = np.unique(pairs[:, 0], return_inverse=True)
+        artist_cols = np.searchsorted(artist_ids, pairs[:, 1])
+        follows = sparse.csr_matrix(
+            (np.ones(len(pairs), dtype=np.int32), (user_cols.ravel(), artist_cols)),
+            shape=(len(user_ids), len(artist_ids))
+        )
+
+        with self._lock:
+            self._reset()
+            self.artist_ids = artist_ids
+            self.index_of = {int(artist_id): i for i, artist_id in enumerate(artist_ids)}
+            self.co = (follows.T @ follows).tocsr()
+            self.degree = self.co.diagonal().astype(np.int64)
+            self.built_at = time.monotonic()
+            self.stale = False
+            self._replay(pairs)
+            # Released under the same lock hold, so no follow can slip between
+            # the replay and the end of logging
+            self._rebuilding = False
+            self._pending = []
+
+    def _replay(self, pairs: np.ndarray) -> None:
+        """
+        Apply the follows logged during a rebuild, starting from each user's
+        follows as the rebuild read them. A logged change the read already
+        included finds the user's follow set in its target state and is skipped.
+        """
+        follows_of: Dict[int, set] = {}
+        for user_id, artist_id, change in self._pending:
+            if user_id not in follows_of:
+                follows_of[user_id] = set(pairs[pairs[:, 0] == user_id, 1].tolist())
+            followed = follows_of[user_id]
+            if (artist_id in followed) == (change > 0):
+                continue
+            others = list(followed - {artist_id})
+            if change > 0:
+                followed.add(artist_id)
+            else:
+                followed.discard(artist_id)
+            self._apply_follow(artist_id, others, change)
+
+    def _merge_deltas(self) -> None:
+        rows, cols, values = [], [], []
+        for i, row in self.deltas.items():
+            for j, value in row.items():
+                rows.append(i)
+                cols.append(j)
+                values.append(value)
+        delta = sparse.csr_matrix((values, (rows, cols)), shape=self.co.shape, dtype=np.int32)
+        self.co = (self.co + delta).tocsr()
+        self.co.eliminate_zeros()
+        self.deltas.clear()
+        self.delta_count = 0
+
+    def record_follow(self, db: Session, user_id: int, artist_id: int, change: int) -> None:
+        """
+        Apply a follow (+1) or unfollow (-1) after it was written to the Follower table.
+        """
+        with self._lock:
+            if self._rebuilding:
+                self._pending.append((user_id, artist_id, change))
+                return
+
+        others = [row[0] for row in db.query(models.Follower.artist_id)
+                  .filter(models.Follower.user_id == user_id,
+                          models.Follower.artist_id != artist_id)
+                  .all()]
+
+        with self._lock:
+            if self._rebuilding:
+                self._pending.append((user_id, artist_id, change))
+                return
+            self._apply_follow(artist_id, others, change)
+
+    def _apply_follow(self, artist_id: int, others: List[int], change: int) -> None:
+        """Add one follow change to the deltas. The caller holds the lock."""
+        if self.stale:
+            return
+        if artist_id not in self.index_of or any(other not in self.index_of for other in others):
+            # A new artist needs a wider matrix
+            self.stale = True
+            return
+
+        i = self.index_of[artist_id]
+        self.degree[i] += change
+        # The follower count feeds every score involving this artist, so drop
+        # the cached lists of all its current neighbours too
+        neighbours = set(self.co.getrow(i).indices.tolist()) | set(self.deltas.get(i, {}))
+        for j in neighbours:
+            self.top.pop(int(self.artist_ids[j]), None)
+        self.top.pop(artist_id, None)
+        for other in others:
+            j = self.index_of[other]
+            self.deltas[i][j] += change
+            self.deltas[j][i] += change
+            self.top.pop(other, None)
+        self.delta_count += 2 * len(others)
+
+        if self.delta_count >= SIMILAR_ARTISTS_MERGE_THRESHOLD:
+            self._merge_deltas()
+
+    def _neighbours(self, i: int) -> List[Tuple[int, float]]:
+        row = self.co.getrow(i)
+        counts = dict(zip(row.indices.tolist(), row.data.tolist()))
+        for j, value in self.deltas.get(i, {}).items():
+            counts[j] = counts.get(j, 0) + value
+        counts.pop(i, None)
+
+        cols = np.fromiter((j for j, count in counts.items() if count > 0), dtype=np.int64)
+        if len(cols) == 0:
+            return []
+        shared = np.fromiter((counts[j] for j in cols.tolist()), dtype=np.float64)
+        degrees = self.degree[cols].astype(np.float64)
+        own_degree = float(self.degree[i])
+
+        if self.metric == 'jaccard':
+            scores = shared / (own_degree + degrees - shared)
+        else:
+            scores = shared / np.sqrt(own_degree * degrees)
+
+        k = min(self.top_k, len(cols))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(int(self.artist_ids[cols[b]]), round(float(scores[b]), 4)) for b in best]
+
+    def similar(self, db: Session, artist_id: int, limit: int) -> List[Tuple[int, float]]:
+        with self._lock:
+            due = self.stale or time.monotonic() - self.built_at > SIMILAR_ARTISTS_REBUILD_SECONDS
+        # Callers arriving while another one rebuilds are served from the current matrix
+        if due:
+            self.rebuild(db)
+
+        with self._lock:
+            if artist_id not in self.index_of:
+                return []
+            if artist_id not in self.top:
+                self.top[artist_id] = self._neighbours(self.index_of[artist_id])
+            return self.top[artist_id][:limit]
+
+
+co_follow_index = CoFollowIndex()
@@ -0,0 +1,85 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from datamanager.shared_store import get_shared_store
+
+# Revocations older than the longest token lifetime can be forgotten
+REVOCATION_TTL_SECONDS = int(os.environ.get('REVOCATION_TTL_SECONDS', 24 * 60 * 60))
+REVOCATION_SYNC_SECONDS = float(os.environ.get('REVOCATION_SYNC_SECONDS', 1))
+
+
+class RevocationList:
+    """
+    Compact in-memory revocations, checked on every authenticated request.
+
+    Keys are either "jti:<id>" for a single token or "sub:<type>:<id>" for
+    every token of a user/artist issued before the revocation time. When a
+    shared store is configured, revocations made by other workers are pulled
+    in at most every REVOCATION_SYNC_SECONDS.
+    """
+
+    def __init__(self):
+        self._revoked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._synced_until = 0.0
+        self._last_sync = 0.0
+        self._store = get_shared_store()
+        if self._store is not None:
+            self._store.connection().execute(
+                'CREATE TABLE IF NOT EXISTS token_revocation '
+                '(key TEXT PRIMARY KEY, revoked_at REAL NOT NULL)'
+            )
+
+    def _add(self, key: str, revoked_at: float) -> None:
+        with self._lock:
+            self._revoked[key] = max(revoked_at, self._revoked.get(key, 0.0))
+
+    def revoke(self, key: str) -> None:
+        revoked_at = time.time()
+        self._add(key, revoked_at)
+        if self._store is not None:
+            with self._store.transaction() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO token_revocation (key, revoked_at) VALUES (?, ?)',
+                    (key, revoked_at)
+                )
+                conn.execute(
+                    'DELETE FROM token_revocation WHERE revoked_at < ?',
+                    (revoked_at - REVOCATION_TTL_SECONDS,)
+                )
+
+    def revoke_subject(self, token_type: str, subject_id: int) -> None:
+        """Invalidate every token already issued to this user or artist."""
+        self.revoke(f"sub:{token_type}:{subject_id}")
+
+    def _sync(self) -> None:
+        now = time.time()
+        if self._store is None or now - self._last_sync < REVOCATION_SYNC_SECONDS:
+            return
+        self._last_sync = now
+        rows = self._store.connection().execute(
+            'SELECT key, revoked_at FROM token_revocation WHERE revoked_at > ?',
+            (self._synced_until,)
+        ).fetchall()
+        for key, revoked_at in rows:
+            self._add(key, revoked_at)
+            self._synced_until = max(self._synced_until, revoked_at)
+
+        with self._lock:
+            cutoff = now - REVOCATION_TTL_SECONDS
+            for key in [key for key, revoked_at in self._revoked.items() if revoked_at < cutoff]:
+                del self._revoked[key]
+
+    def is_revoked(self, token_type: str, subject_id: str, jti: Optional[str], issued_at: float) -> bool:
+        self._sync()
+        if not self._revoked:
+            return False
+        if jti is not None and f"jti:{jti}" in self._revoked:
+            return True
+        subject_revoked_at = self._revoked.get(f"sub:{token_type}:{subject_id}")
+        return subject_revoked_at is not None and issued_at <= subject_revoked_at
+
+
+revocation_list = RevocationList()
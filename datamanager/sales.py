@@ -0,0 +1,131 @@
+from collections import defaultdict
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+from datamanager.database import dialect_insert
+
+
+def _upsert_add(db: Session, model, keys: dict, revenue: float, units: int) -> None:
+    """Insert a rollup row or add the deltas to the existing one in a single statement."""
+    stmt = dialect_insert(db)(model.__table__).values(**keys, revenue=revenue, units=units)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={
+            "revenue": model.__table__.c.revenue + stmt.excluded.revenue,
+            "units": model.__table__.c.units + stmt.excluded.units,
+        }
+    )
+    db.execute(stmt)
+
+
+def _item_artist_and_day(db: Session, order_id: int, item_id: int, item_type: str):
+    item_model = models.Track if item_type == "track" else models.Album
+    # Orders that are not Completed have not been paid for and count for nothing
+    return (db.query(item_model.artist_id, func.date(models.Order.order_date))
+            .filter(item_model.id == item_id,
+                    models.Order.id == order_id,
+                    models.Order.status == "Completed")
+            .first())
+
+
+def apply_sale(
+        db: Session,
+        order_id: int,
+        item_id: int,
+        item_type: str,
+        quantity: int,
+        subtotal: Optional[float],
+        sign: int = 1
+) -> None:
+    """
+    Add (sign=1) or remove (sign=-1) one order item's contribution to the
+    artist rollups. Does nothing unless the order is Completed.
+    """
+    row = _item_artist_and_day(db, order_id, item_id, item_type)
+    if row is None:
+        return
+
+    artist_id, day = row
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    revenue = sign * (subtotal or 0.0)
+    units = sign * quantity
+
+    _upsert_add(db, models.ArtistSalesDaily, {"artist_id": artist_id, "day": day}, revenue, units)
+    _upsert_add(db, models.ArtistSalesItem,
+                {"artist_id": artist_id, "type": item_type, "item_id": item_id}, revenue, units)
+
+
+def apply_order_sales(db: Session, order_id: int, sign: int = 1) -> None:
+    """Add (sign=1) or remove (sign=-1) every item of a Completed order in the rollups."""
+    items = (db.query(models.OrderItem.item_id, models.OrderItem.type,
+                      models.OrderItem.quantity, models.OrderItem.subtotal)
+             .filter(models.OrderItem.order_id == order_id)
+             .all())
+    for item_id, item_type, quantity, subtotal in items:
+        apply_sale(db, order_id, item_id, item_type, quantity, subtotal, sign=sign)
+
+
+def remove_order_sales(db: Session, order_id: int) -> None:
+    """Remove every item of an order from the rollups, before the order is deleted or un-completed."""
+    apply_order_sales(db, order_id, sign=-1)
+
+
+def rebuild_sales_rollups(db: Session) -> None:
+    """Backfill: recompute both rollup tables from all Completed orders."""
+    daily = defaultdict(lambda: [0.0, 0])
+    per_item = defaultdict(lambda: [0.0, 0])
+
+    for item_model, item_type in ((models.Track, "track"), (models.Album, "album")):
+        rows = (db.query(item_model.artist_id,
+                         func.date(models.Order.order_date),
+                         models.OrderItem.item_id,
+                         func.coalesce(func.sum(models.OrderItem.subtotal), 0.0),
+                         func.sum(models.OrderItem.quantity))
+                .select_from(models.OrderItem)
+                .join(models.Order, models.Order.id == models.OrderItem.order_id)
+                .join(item_model, item_model.id == models.OrderItem.item_id)
+                .filter(models.OrderItem.type == item_type,
+                        models.Order.status == "Completed")
+                .group_by(item_model.artist_id,
+                          func.date(models.Order.order_date),
+                          models.OrderItem.item_id)
+                .all())
+        for artist_id, day, item_id, revenue, units in rows:
+            if isinstance(day, str):
+                day = date.fromisoformat(day)
+            daily[(artist_id, day)][0] += revenue
+            daily[(artist_id, day)][1] += units
+            per_item[(artist_id, item_type, item_id)][0] += revenue
+            per_item[(artist_id, item_type, item_id)][1] += units
+
+    db.query(models.ArtistSalesDaily).delete(synchronize_session=False)
+    db.query(models.ArtistSalesItem).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.ArtistSalesDaily, [
+        {"artist_id": artist_id, "day": day, "revenue": revenue, "units": units}
+        for (artist_id, day), (revenue, units) in daily.items()
+    ])
+    db.bulk_insert_mappings(models.ArtistSalesItem, [
+        {"artist_id": artist_id, "type": item_type, "item_id": item_id,
+         "revenue": revenue, "units": units}
+        for (artist_id, item_type, item_id), (revenue, units) in per_item.items()
+    ])
+    db.commit()
+
+
+if __name__ == "__main__":
+    from datamanager.database import SessionLocal, engine
+
+    models.Base.metadata.create_all(
+        bind=engine,
+        tables=[models.ArtistSalesDaily.__table__, models.ArtistSalesItem.__table__]
+    )
+    session = SessionLocal()
+    try:
+        rebuild_sales_rollups(session)
+    finally:
+        session.close()
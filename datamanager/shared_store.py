@@ -0,0 +1,56 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# Path of a SQLite file shared by all worker processes on this host; unset keeps state per process
+SHARED_STORE_PATH = os.environ.get('SHARED_STORE_PATH')
+
+
+class SharedStore:
+    """
+    Small host-local key/value state shared between worker processes through
+    one SQLite file in WAL mode. Each thread of each process gets its own
+    connection, and writers serialize through BEGIN IMMEDIATE.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+
+_shared_store: Optional[SharedStore] = None
+_shared_store_lock = threading.Lock()
+
+
+def get_shared_store() -> Optional[SharedStore]:
+    global _shared_store
+    if SHARED_STORE_PATH is None:
+        return None
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = SharedStore(SHARED_STORE_PATH)
+    return _shared_store
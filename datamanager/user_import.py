@@ -0,0 +1,263 @@
+import asyncio
+import codecs
+import csv
+import heapq
+import io
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+
+import models
+from datamanager.database import SessionLocal, dialect_insert
+from password_hashing import get_password_hash
+from schemas.user_schemas import UserImportRow, UserRole
+
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+# Processes hashing imported passwords; defaults to every core
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', os.cpu_count() or 1))
+MAX_REPORTED_ERRORS = 1000
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = ("id", "username", "email", "name", "date_of_birth", "role", "disabled", "created_at")
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _hash_chunk(passwords: List[str]) -> List[str]:
+    return [get_password_hash(password) for password in passwords]
+
+
+async def hash_passwords(passwords: List[str]) -> List[str]:
+    """Hash passwords in HASH_WORKERS processes, one contiguous chunk per process."""
+    global _executor
+    if not passwords:
+        return []
+    if _executor is None:
+        # Forking a worker that already runs background threads can copy held locks into the child
+        _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    size = -(-len(passwords) // HASH_WORKERS)
+    loop = asyncio.get_running_loop()
+    chunks = await asyncio.gather(*(
+        loop.run_in_executor(_executor, _hash_chunk, passwords[start:start + size])
+        for start in range(0, len(passwords), size)
+    ))
+    return [hashed for chunk in chunks for hashed in chunk]
+
+
+def shutdown_hashing_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """Split a streamed body into numbered, non-empty lines, without a leading byte order mark."""
+    pending = b""
+    line_no = 0
+    async for chunk in chunks:
+        pending += chunk
+        *complete, pending = pending.split(b"\n")
+        for raw in complete:
+            line_no += 1
+            if line_no == 1:
+                raw = raw.removeprefix(codecs.BOM_UTF8)
+            if raw.strip():
+                yield line_no, raw.rstrip(b"\r")
+    if line_no == 0:
+        pending = pending.removeprefix(codecs.BOM_UTF8)
+    if pending.strip():
+        yield line_no + 1, pending.rstrip(b"\r")
+
+
+async def _records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, object]]:
+    """Yield (line number, dict) per record, or (line number, error message) for unreadable lines."""
+    header = None
+    async for line_no, raw in _lines(chunks):
+        try:
+            line = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            yield line_no, "Invalid UTF-8"
+            if fmt == CSV and header is None:
+                # Without the header no later row can be read
+                return
+            continue
+
+        if fmt == NDJSON:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_no, "Invalid JSON"
+                continue
+            yield line_no, record if isinstance(record, dict) else "Expected a JSON object"
+            continue
+
+        # One record per line; quoted fields spanning lines are not supported
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield line_no, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield line_no, {name: value for name, value in zip(header, values) if value != ""}
+
+
+def _insert_batch(rows: List[Dict]) -> set:
+    """Insert one batch in a single transaction. Returns the usernames actually inserted."""
+    db = SessionLocal()
+    try:
+        stmt = (dialect_insert(db)(models.User.__table__)
+                .values(rows)
+                .on_conflict_do_nothing()
+                .returning(models.User.__table__.c.username))
+        inserted = {username for (username,) in db.execute(stmt)}
+        db.commit()
+        return inserted
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        # Max-heap on line number, so the MAX_REPORTED_ERRORS earliest lines are kept
+        self._errors: List[Tuple[int, int, str]] = []
+
+    def error(self, line_no: int, message: str) -> None:
+        # Duplicates are only found when their batch is flushed, after later lines were read
+        self.failed += 1
+        entry = (-line_no, -self.failed, message)
+        if len(self._errors) < MAX_REPORTED_ERRORS:
+            heapq.heappush(self._errors, entry)
+        elif entry > self._errors[0]:
+            heapq.heapreplace(self._errors, entry)
+
+    def as_dict(self) -> Dict:
+        errors = [{"line": -line_no, "error": message} for line_no, _, message in sorted(self._errors, reverse=True)]
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": errors,
+            "errors_truncated": self.failed > len(errors),
+        }
+
+
+async def _flush(batch: List[Tuple[int, UserImportRow]], report: ImportReport) -> None:
+    to_hash = [row.password for _, row in batch if row.password_hash is None]
+    hashes = iter(await hash_passwords(to_hash))
+
+    rows = []
+    for _, row in batch:
+        rows.append({
+            "username": row.username,
+            "email": row.email,
+            "password": row.password_hash or next(hashes),
+            "name": row.name,
+            "date_of_birth": row.date_of_birth,
+            "role": row.role,
+            "disabled": row.disabled,
+        })
+    inserted = await run_in_threadpool(_insert_batch, rows)
+
+    for line_no, row in batch:
+        if row.username in inserted:
+            report.imported += 1
+        else:
+            report.error(line_no, "Username or email already exists")
+
+
+async def import_users(chunks: AsyncIterator[bytes], fmt: str, allow_admin: bool = False) -> Dict:
+    """
+    Stream users from a CSV (with a header line) or NDJSON body. Passwords are
+    hashed in a process pool and rows are inserted IMPORT_BATCH_SIZE at a time,
+    each batch in one transaction. Bad or duplicate rows are reported by line
+    number without stopping the import. Rows with a role other than user are
+    rejected unless `allow_admin` is set.
+    """
+    report = ImportReport()
+    batch: List[Tuple[int, UserImportRow]] = []
+    usernames, emails = set(), set()
+
+    async for line_no, record in _records(chunks, fmt):
+        if isinstance(record, str):
+            report.error(line_no, record)
+            continue
+        try:
+            row = UserImportRow.model_validate(record)
+        except ValidationError as error:
+            report.error(line_no, "; ".join(
+                f"{'.'.join(map(str, detail['loc'])) or 'row'}: {detail['msg']}" for detail in error.errors()
+            ))
+            continue
+        if row.role != UserRole.USER and not allow_admin:
+            report.error(line_no, f"role: {row.role.value} accounts can only be imported with allow_admin")
+            continue
+        # The database can't tell which of two clashing rows in one statement lost
+        if row.username in usernames or row.email in emails:
+            report.error(line_no, "Username or email already exists")
+            continue
+        usernames.add(row.username)
+        emails.add(row.email)
+        batch.append((line_no, row))
+
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await _flush(batch, report)
+            batch = []
+            usernames, emails = set(), set()
+
+    if batch:
+        await _flush(batch, report)
+    return report.as_dict()
+
+
+def export_users(fmt: str) -> Iterator[str]:
+    """Yield every user (without password hashes) as CSV or NDJSON, reading EXPORT_BATCH_SIZE rows at a time."""
+    columns = [getattr(models.User, name) for name in EXPORT_COLUMNS]
+    if fmt == CSV:
+        yield ",".join(EXPORT_COLUMNS) + "\r\n"
+
+    db = SessionLocal()
+    try:
+        last_id = 0
+        while True:
+            rows = (db.query(*columns)
+                    .filter(models.User.id > last_id)
+                    .order_by(models.User.id)
+                    .limit(EXPORT_BATCH_SIZE)
+                    .all())
+            if not rows:
+                return
+            last_id = rows[-1].id
+
+            if fmt == NDJSON:
+                yield "".join(
+                    json.dumps({name: _export_value(value) for name, value in zip(EXPORT_COLUMNS, row)}) + "\n"
+                    for row in rows
+                )
+            else:
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerows([_export_value(value) for value in row] for row in rows)
+                yield buffer.getvalue()
+    finally:
+        db.close()
+
+
+def _export_value(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if hasattr(value, "value"):
+        return value.value
+    return value
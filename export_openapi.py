@@ -0,0 +1,21 @@
+"""
+Write the OpenAPI document to a file at build time.
+
+    python export_openapi.py openapi.json
+
+Point OPENAPI_SCHEMA_PATH at the output so workers load it instead of
+generating the schema on the first /docs or /openapi.json request.
+"""
+import json
+import os
+import sys
+
+if __name__ == "__main__":
+    output_path = sys.argv[1] if len(sys.argv) > 1 else "openapi.json"
+    os.environ.pop("OPENAPI_SCHEMA_PATH", None)
+
+    from main import app
+
+    with open(output_path, "w") as schema_file:
+        json.dump(app.openapi(), schema_file)
+    print(f"OpenAPI schema written to {output_path}")
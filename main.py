@@ -1,8 +1,19 @@
+import json
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.openapi.utils import get_openapi
+from sqlalchemy import text
 
 import models as models
-from datamanager.database import engine
+from datamanager.catalog import catalog_snapshot, CATALOG_SNAPSHOT
+from datamanager.database import engine, DB_POOL_SIZE
+from datamanager.peaks import shutdown_peaks_executor
+from datamanager.plays import play_buffer
+from datamanager.user_import import shutdown_hashing_executor
+from middleware.encoding import ResponseEncodingMiddleware
+from middleware.rate_limit import RateLimitMiddleware
 from routes import (
     user,
     artist,
@@ -10,17 +21,67 @@ from routes import (
     order,
     album,
     order_item,
-    user_payment_method
+    user_payment_method,
+    play,
+    cart
 )
 
+# Set CREATE_TABLES=0 when the schema is managed outside the app
+CREATE_TABLES = os.environ.get("CREATE_TABLES", "1") == "1"
+# Path to an OpenAPI document generated at build time with export_openapi.py
+OPENAPI_SCHEMA_PATH = os.environ.get("OPENAPI_SCHEMA_PATH")
+
+
+def warm_db_pool(size: int = DB_POOL_SIZE) -> None:
+    """Open the pool's connections up front so the first requests don't pay for them."""
+    connections = []
+    try:
+        for _ in range(size):
+            connection = engine.connect()
+            connection.execute(text("SELECT 1"))
+            connections.append(connection)
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if CREATE_TABLES:
+        models.Base.metadata.create_all(bind=engine)
+    warm_db_pool()
+    if OPENAPI_SCHEMA_PATH:
+        app.openapi()
+    play_buffer.start()
+    if CATALOG_SNAPSHOT:
+        catalog_snapshot.start()
+    yield
+    catalog_snapshot.stop()
+    # Buffered plays are written before the worker exits
+    play_buffer.stop()
+    shutdown_peaks_executor()
+    shutdown_hashing_executor()
+    engine.dispose()
+
+
 app = FastAPI(
     title="HarmonApp API",
     description="Musician and User Oriented Streaming Platform API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+
+def load_prebuilt_openapi():
+    if not OPENAPI_SCHEMA_PATH or not os.path.exists(OPENAPI_SCHEMA_PATH):
+        return None
+    with open(OPENAPI_SCHEMA_PATH) as schema_file:
+        return json.load(schema_file)
+
+
+app.add_middleware(RateLimitMiddleware)
+# Outermost, so every response (including 429s) is negotiated and compressed
+app.add_middleware(ResponseEncodingMiddleware)
 
 
 # Custom OpenAPI schema to support multiple auth schemes
@@ -28,6 +89,11 @@ def custom_openapi():
     if app.openapi_schema:
         return app.openapi_schema
 
+    prebuilt_schema = load_prebuilt_openapi()
+    if prebuilt_schema is not None:
+        app.openapi_schema = prebuilt_schema
+        return app.openapi_schema
+
     openapi_schema = get_openapi(
         title=app.title,
         version=app.version,
@@ -79,3 +145,5 @@ app.include_router(album.router)
 app.include_router(order.router)
 app.include_router(order_item.router)
 app.include_router(user_payment_method.router)
+app.include_router(play.router)
+app.include_router(cart.router)
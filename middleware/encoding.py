@@ -0,0 +1,191 @@
+import gzip
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Both formats are optional; without the package the format is just never offered
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 4))
+# Compressed bodies of cacheable responses kept for reuse
+PRECOMPRESSED_CACHE_SIZE = int(os.environ.get('PRECOMPRESSED_CACHE_SIZE', 256))
+# Bodies larger than this are compressed off the event loop
+THREADPOOL_COMPRESS_BYTES = 256 * 1024
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def parse_quality(header: Optional[str]) -> Dict[str, float]:
+    """Map each value of an Accept-style header to its q weight."""
+    weights = {}
+    for part in (header or "").split(","):
+        value, *params = [piece.strip() for piece in part.split(";")]
+        if not value:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, number = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        weights[value.lower()] = quality
+    return weights
+
+
+def prefers_msgpack(accept: Optional[str]) -> bool:
+    """True when the client asks for MessagePack at least as strongly as for JSON."""
+    if msgpack is None or not accept:
+        return False
+    weights = parse_quality(accept)
+    msgpack_quality = max(weights.get(media_type, 0.0) for media_type in MSGPACK_TYPES)
+    return msgpack_quality > 0 and msgpack_quality >= weights.get("application/json", 0.0)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    weights = parse_quality(accept_encoding)
+    wildcard = weights.get("*", 0.0)
+    gzip_quality = weights.get("gzip", wildcard)
+    brotli_quality = weights.get("br", wildcard) if brotli is not None else 0.0
+    if brotli_quality > 0 and brotli_quality >= gzip_quality:
+        return "br"
+    if gzip_quality > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class PrecompressedCache:
+    """LRU of compressed bodies keyed by body digest, for responses marked cacheable."""
+
+    def __init__(self, max_size: int = PRECOMPRESSED_CACHE_SIZE):
+        self.max_size = max_size
+        self._bodies: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self.hits = 0
+
+    def get(self, body: bytes, encoding: str) -> Optional[bytes]:
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+        compressed = self._bodies.get(key)
+        if compressed is not None:
+            self._bodies.move_to_end(key)
+            self.hits += 1
+        return compressed
+
+    def put(self, body: bytes, encoding: str, compressed: bytes) -> None:
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+        self._bodies[key] = compressed
+        if len(self._bodies) > self.max_size:
+            self._bodies.popitem(last=False)
+
+
+class ResponseEncodingMiddleware:
+    """
+    Negotiates the response format and compression for buffered responses.
+
+    JSON bodies are re-encoded as MessagePack when the Accept header prefers
+    it, and bodies of at least COMPRESSION_MIN_BYTES are compressed with
+    brotli or gzip per Accept-Encoding. Streaming responses and bodies that
+    already carry a Content-Encoding pass through untouched.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = PrecompressedCache()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        to_msgpack = prefers_msgpack(request_headers.get("accept"))
+        encoding = choose_encoding(request_headers.get("accept-encoding"))
+        if not to_msgpack and encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        passthrough = False
+
+        async def send_encoded(message: Message) -> None:
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start_message["headers"])
+            if message.get("more_body", False) or "content-encoding" in headers:
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            body = await self._encode(headers, message.get("body", b""), to_msgpack, encoding)
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_encoded)
+
+    async def _encode(
+            self,
+            headers: MutableHeaders,
+            body: bytes,
+            to_msgpack: bool,
+            encoding: Optional[str]
+    ) -> bytes:
+        content_type = headers.get("content-type", "")
+        vary = ["Accept-Encoding"]
+        if msgpack is not None:
+            vary.insert(0, "Accept")
+        for value in vary:
+            headers.add_vary_header(value)
+
+        original_size = len(body)
+        if to_msgpack and content_type.startswith("application/json") and body:
+            body = msgpack.packb(json.loads(body))
+            headers["content-type"] = "application/msgpack"
+
+        if encoding is not None and len(body) >= self.minimum_size:
+            cache_control = headers.get("cache-control", "")
+            cacheable = "public" in cache_control or "max-age" in cache_control
+            compressed = self.cache.get(body, encoding) if cacheable else None
+            if compressed is None:
+                if len(body) > THREADPOOL_COMPRESS_BYTES:
+                    compressed = await run_in_threadpool(compress, body, encoding)
+                else:
+                    compressed = compress(body, encoding)
+                if cacheable:
+                    self.cache.put(body, encoding, compressed)
+            body = compressed
+            headers["content-encoding"] = encoding
+
+        if len(body) != original_size or "content-encoding" in headers:
+            headers["content-length"] = str(len(body))
+        return body
@@ -0,0 +1,257 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import jwt
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from auth_utils import SECRET_KEY, ALGORITHM
+from datamanager.shared_store import SharedStore, get_shared_store
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+MEMORY_STORE_MAX_KEYS = 100_000
+MAX_LOGIN_BODY_BYTES = 16 * 1024
+# How often each worker deletes shared buckets that have refilled completely
+SHARED_BUCKET_PRUNE_SECONDS = 60
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    """
+    A token bucket applied to requests whose method matches and whose path
+    starts with `path`. `key` is "ip" for the client address or "principal"
+    for the authenticated user/artist (or the username on login routes).
+    """
+    name: str
+    methods: Tuple[str, ...]
+    path: str
+    key: str
+    capacity: int
+    refill_per_second: float
+
+
+RATE_LIMIT_RULES = (
+    # Logins run bcrypt, so they are throttled hard per client and per account
+    RateLimitRule("user-login-ip", ("POST",), "/users/token", "ip", 10, 10 / 60),
+    RateLimitRule("user-login-account", ("POST",), "/users/token", "principal", 5, 5 / 60),
+    RateLimitRule("artist-login-ip", ("POST",), "/artists/token", "ip", 10, 10 / 60),
+    RateLimitRule("artist-login-account", ("POST",), "/artists/token", "principal", 5, 5 / 60),
+    # Catalog browsing quotas
+    RateLimitRule("catalog-ip", ("GET", "POST"), "/tracks", "ip", 100, 20),
+    RateLimitRule("catalog-ip", ("GET", "POST"), "/albums", "ip", 100, 20),
+    RateLimitRule("catalog-ip", ("GET", "POST"), "/artists", "ip", 100, 20),
+    RateLimitRule("catalog-principal", ("GET", "POST"), "/tracks", "principal", 200, 50),
+    RateLimitRule("catalog-principal", ("GET", "POST"), "/albums", "principal", 200, 50),
+    RateLimitRule("catalog-principal", ("GET", "POST"), "/artists", "principal", 200, 50),
+)
+
+
+# (key, capacity, refill_per_second) of one bucket a request draws from
+Bucket = Tuple[str, int, float]
+
+
+def _refill(tokens: float, updated: float, now: float, capacity: int, refill_per_second: float) -> float:
+    return min(capacity, tokens + max(0.0, now - updated) * refill_per_second)
+
+
+def _wait(tokens: float, refill_per_second: float) -> float:
+    return 0.0 if tokens >= 1 else (1 - tokens) / refill_per_second
+
+
+class MemoryBucketStore:
+    """Per-process token buckets, least recently used keys evicted past MEMORY_STORE_MAX_KEYS."""
+
+    # Only takes an in-process lock, so it is called on the event loop
+    blocking = False
+
+    def __init__(self, max_keys: int = MEMORY_STORE_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take_all(self, buckets: List[Bucket]) -> float:
+        """
+        Take one token from every bucket, or from none of them if any is
+        empty. Returns 0 if allowed, else the seconds until all have a token.
+        """
+        now = time.monotonic()
+        with self._lock:
+            refilled = []
+            for key, capacity, refill_per_second in buckets:
+                tokens, updated = self._buckets.get(key, (capacity, now))
+                refilled.append(_refill(tokens, updated, now, capacity, refill_per_second))
+            wait = max((_wait(tokens, bucket[2]) for tokens, bucket in zip(refilled, buckets)), default=0.0)
+            for tokens, (key, _, _) in zip(refilled, buckets):
+                self._buckets.pop(key, None)
+                self._buckets[key] = (tokens - 1 if wait == 0 else tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class SharedBucketStore:
+    """Token buckets in the host-local shared store, so all workers draw from the same bucket."""
+
+    # SQLite may wait on another worker's write lock, so it is called off the event loop
+    blocking = True
+
+    def __init__(self, store: SharedStore):
+        self.store = store
+        self._pruned_at = 0.0
+        conn = self.store.connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS rate_limit_bucket '
+            '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL DEFAULT 0)'
+        )
+        # Tables created before full_at existed
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(rate_limit_bucket)')}
+        if 'full_at' not in columns:
+            conn.execute('ALTER TABLE rate_limit_bucket ADD COLUMN full_at REAL NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_rate_limit_bucket_full_at ON rate_limit_bucket (full_at)')
+
+    def take_all(self, buckets: List[Bucket]) -> float:
+        """Like MemoryBucketStore.take_all, with all buckets read and written in one transaction."""
+        now = time.time()
+        with self.store.transaction() as conn:
+            refilled = []
+            for key, capacity, refill_per_second in buckets:
+                row = conn.execute(
+                    'SELECT tokens, updated FROM rate_limit_bucket WHERE key = ?', (key,)
+                ).fetchone()
+                tokens, updated = row if row else (capacity, now)
+                refilled.append(_refill(tokens, updated, now, capacity, refill_per_second))
+            wait = max((_wait(tokens, bucket[2]) for tokens, bucket in zip(refilled, buckets)), default=0.0)
+            rows = []
+            for tokens, (key, capacity, refill_per_second) in zip(refilled, buckets):
+                if wait == 0:
+                    tokens -= 1
+                rows.append((key, tokens, now, now + (capacity - tokens) / refill_per_second))
+            conn.executemany(
+                'INSERT OR REPLACE INTO rate_limit_bucket (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)',
+                rows
+            )
+            # A full bucket behaves like a missing one, so it can go. Login
+            # buckets are keyed by whatever username is posted, and this keeps
+            # the table from growing with them
+            if now - self._pruned_at > SHARED_BUCKET_PRUNE_SECONDS:
+                conn.execute('DELETE FROM rate_limit_bucket WHERE full_at <= ?', (now,))
+                self._pruned_at = now
+        return wait
+
+
+def _bearer_principal(scope: Scope) -> Optional[str]:
+    """The token's subject, checked by signature only (no database access)."""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            try:
+                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            except jwt.InvalidTokenError:
+                return None
+            return f"{payload.get('token_type')}:{payload.get('sub')}"
+    return None
+
+
+class RateLimitMiddleware:
+    """
+    Rejects requests over their route's token buckets with 429 and Retry-After
+    before the request reaches any handler, so no DB or bcrypt work is done.
+    """
+
+    def __init__(self, app: ASGIApp, rules=RATE_LIMIT_RULES, store=None):
+        self.app = app
+        self.rules = rules
+        if store is None:
+            shared_store = get_shared_store()
+            store = SharedBucketStore(shared_store) if shared_store else MemoryBucketStore()
+        self.store = store
+
+    def _matching_rules(self, scope: Scope):
+        method = scope["method"]
+        path = scope["path"]
+        return [rule for rule in self.rules
+                if method in rule.methods
+                and (path == rule.path or path.startswith(rule.path + "/"))]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        rules = self._matching_rules(scope)
+        if not rules:
+            await self.app(scope, receive, send)
+            return
+
+        principal = None
+        if any(rule.key == "principal" for rule in rules):
+            if scope["path"].endswith("/token"):
+                principal, receive = await self._login_principal(receive)
+            else:
+                principal = _bearer_principal(scope)
+
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+
+        buckets = []
+        for rule in rules:
+            if rule.key == "ip":
+                key = f"{rule.name}:ip:{client_ip}"
+            elif principal is not None:
+                key = f"{rule.name}:principal:{principal}"
+            else:
+                continue
+            buckets.append((key, rule.capacity, rule.refill_per_second))
+
+        if self.store.blocking:
+            retry_after = await run_in_threadpool(self.store.take_all, buckets)
+        else:
+            retry_after = self.store.take_all(buckets)
+
+        if retry_after > 0:
+            response = JSONResponse(
+                {"detail": "Too many requests"},
+                status_code=429,
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _login_principal(receive: Receive):
+        """Read the login form to key the bucket by username, then replay the body downstream."""
+        messages = []
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if len(body) > MAX_LOGIN_BODY_BYTES:
+                break
+
+        username = None
+        if not more_body:
+            values = parse_qs(body.decode("utf-8", errors="replace")).get("username")
+            username = f"login:{values[0]}" if values else None
+
+        async def replay() -> dict:
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        return username, replay
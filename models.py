@@ -1,5 +1,5 @@
 from sqlalchemy import String, Integer, Boolean, Column, text, TIMESTAMP, Date, ForeignKey, Float
-from sqlalchemy import PrimaryKeyConstraint, Enum as SQLAlchemyEnum
+from sqlalchemy import PrimaryKeyConstraint, Index, Enum as SQLAlchemyEnum
 from sqlalchemy.orm import relationship
 
 from datamanager.database import Base
@@ -20,10 +20,16 @@ class User(Base):
     disabled = Column(Boolean, nullable=False)
 
     # Relationships
-    followed_artists = relationship('Follower', back_populates='user')
-    playlists = relationship('Playlist', back_populates='user')
-    orders = relationship('Order', back_populates='user')
-    payment_methods = relationship('UserPaymentMethod', back_populates='user')
+    # Child rows are removed by the database through ON DELETE CASCADE,
+    # so the ORM must not load the collections just to delete them
+    followed_artists = relationship('Follower', back_populates='user',
+                                    cascade='all, delete', passive_deletes=True)
+    playlists = relationship('Playlist', back_populates='user',
+                             cascade='all, delete', passive_deletes=True)
+    orders = relationship('Order', back_populates='user',
+                          cascade='all, delete', passive_deletes=True)
+    payment_methods = relationship('UserPaymentMethod', back_populates='user',
+                                   cascade='all, delete', passive_deletes=True)
 
 
 class Artist(Base):
@@ -40,9 +46,16 @@ class Artist(Base):
     disabled = Column(Boolean, nullable=False)
 
     # Relationships
-    followers = relationship('Follower', back_populates='artist')
-    tracks = relationship('Track', back_populates='artist')
-    albums = relationship('Album', back_populates='artist')
+    followers = relationship('Follower', back_populates='artist',
+                             cascade='all, delete', passive_deletes=True)
+    tracks = relationship('Track', back_populates='artist',
+                          cascade='all, delete', passive_deletes=True)
+    albums = relationship('Album', back_populates='artist',
+                          cascade='all, delete', passive_deletes=True)
+
+    __table_args__ = (
+        Index('ix_artist_genre', 'genre'),
+    )
 
 
 class Follower(Base):
@@ -83,7 +96,8 @@ class Track(Base):
     # Relationships
     artist = relationship('Artist', back_populates='tracks')
     album = relationship('Album', back_populates='tracks')
-    playlist_entries = relationship('PlaylistTrack', back_populates='track')
+    playlist_entries = relationship('PlaylistTrack', back_populates='track',
+                                    cascade='all, delete', passive_deletes=True)
     order_items = relationship(
         'OrderItem',
         primaryjoin="and_(foreign(OrderItem.item_id) == Track.id, "
@@ -92,6 +106,15 @@ class Track(Base):
         viewonly=True
     )
 
+    # Back the catalog list filters and sorts
+    __table_args__ = (
+        Index('ix_track_artist_id_release_date', 'artist_id', 'release_date'),
+        Index('ix_track_album_id_id', 'album_id', 'id'),
+        Index('ix_track_release_date', 'release_date'),
+        Index('ix_track_price', 'price'),
+        Index('ix_track_name_id', 'name', 'id'),
+    )
+
 
 class Album(Base):
     __tablename__ = 'album'
@@ -106,7 +129,8 @@ class Album(Base):
 
     # Relationships
     artist = relationship('Artist', back_populates='albums')
-    tracks = relationship('Track', back_populates='album')
+    tracks = relationship('Track', back_populates='album', order_by='Track.id',
+                          cascade='all, delete', passive_deletes=True)
     order_items = relationship(
         'OrderItem',
         primaryjoin="and_(foreign(OrderItem.item_id) == Album.id, "
@@ -115,6 +139,14 @@ class Album(Base):
         viewonly=True
     )
 
+    # Back the catalog list filters and sorts
+    __table_args__ = (
+        Index('ix_album_artist_id_release_date', 'artist_id', 'release_date'),
+        Index('ix_album_release_date', 'release_date'),
+        Index('ix_album_price', 'price'),
+        Index('ix_album_name_id', 'name', 'id'),
+    )
+
 
 class Playlist(Base):
     __tablename__ = 'playlist'
@@ -127,7 +159,8 @@ class Playlist(Base):
 
     # Relationships
     user = relationship('User', back_populates='playlists')
-    track_entries = relationship('PlaylistTrack', back_populates='playlist')
+    track_entries = relationship('PlaylistTrack', back_populates='playlist',
+                                 cascade='all, delete', passive_deletes=True)
 
 
 class PlaylistTrack(Base):
@@ -167,7 +200,13 @@ class Order(Base):
     # Relationships
     user = relationship('User', back_populates='orders')
     payment_method = relationship('UserPaymentMethod', back_populates='orders')
-    items = relationship('OrderItem', back_populates='order')
+    items = relationship('OrderItem', back_populates='order',
+                         cascade='all, delete', passive_deletes=True)
+
+    # Order history pages walk a user's orders by (order_date, id), the cursor's sort key
+    __table_args__ = (
+        Index('ix_order_user_id_order_date_id', 'user_id', 'order_date', 'id'),
+    )
 
 
 class OrderItem(Base):
@@ -176,7 +215,8 @@ class OrderItem(Base):
     id = Column(Integer, primary_key=True)
     order_id = Column(Integer,
                       ForeignKey('order.id', ondelete='CASCADE'),
-                      nullable=False)
+                      nullable=False,
+                      index=True)
     item_id = Column(Integer, nullable=False)
     type = Column(String, nullable=False)
     price = Column(Float)
@@ -225,4 +265,119 @@ class UserPaymentMethod(Base):
 
     # Relationships
     user = relationship('User', back_populates='payment_methods')
-    orders = relationship('Order', back_populates='payment_method')
+    orders = relationship('Order', back_populates='payment_method',
+                          cascade='all, delete', passive_deletes=True)
+
+
+class Entitlement(Base):
+    """
+    Materialized "user owns track" rows, maintained from order items.
+    Album purchases are expanded into one row per track of the album.
+    """
+    __tablename__ = 'entitlement'
+
+    user_id = Column(Integer,
+                     ForeignKey('user.id', ondelete='CASCADE'),
+                     nullable=False)
+    track_id = Column(Integer,
+                      ForeignKey('track.id', ondelete='CASCADE'),
+                      nullable=False,
+                      index=True)
+    order_item_id = Column(Integer,
+                           ForeignKey('order_item.id', ondelete='CASCADE'),
+                           nullable=False,
+                           index=True)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('user_id', 'track_id', 'order_item_id'),
+    )
+
+
+class ArtistSalesDaily(Base):
+    """Per-artist, per-day sales rollup, maintained incrementally from order items."""
+    __tablename__ = 'artist_sales_daily'
+
+    artist_id = Column(Integer,
+                       ForeignKey('artist.id', ondelete='CASCADE'),
+                       nullable=False)
+    day = Column(Date, nullable=False)
+    revenue = Column(Float, nullable=False, default=0.0)
+    units = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('artist_id', 'day'),
+    )
+
+
+class ArtistSalesItem(Base):
+    """Per-artist, per-item (track or album) sales rollup, maintained incrementally from order items."""
+    __tablename__ = 'artist_sales_item'
+
+    artist_id = Column(Integer,
+                       ForeignKey('artist.id', ondelete='CASCADE'),
+                       nullable=False)
+    type = Column(String, nullable=False)
+    item_id = Column(Integer, nullable=False)
+    revenue = Column(Float, nullable=False, default=0.0)
+    units = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('artist_id', 'type', 'item_id'),
+    )
+
+
+class Job(Base):
+    """Background job queue row, claimed by worker.py with FOR UPDATE SKIP LOCKED."""
+    __tablename__ = 'job'
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    order_id = Column(Integer,
+                      ForeignKey('order.id', ondelete='CASCADE'),
+                      nullable=False)
+    status = Column(String, nullable=False, default='queued')
+    attempts = Column(Integer, nullable=False, default=0)
+    run_at = Column(TIMESTAMP, nullable=False)
+    locked_at = Column(TIMESTAMP)
+    last_error = Column(String)
+    created_at = Column(TIMESTAMP, nullable=False, server_default=text('Now()'))
+
+    __table_args__ = (
+        Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+
+class Play(Base):
+    __tablename__ = 'play'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer,
+                     ForeignKey('user.id', ondelete='CASCADE'),
+                     nullable=False)
+    track_id = Column(Integer,
+                      ForeignKey('track.id', ondelete='CASCADE'),
+                      nullable=False)
+    played_at = Column(TIMESTAMP, nullable=False)
+
+    __table_args__ = (
+        Index('ix_play_user_id_played_at', 'user_id', 'played_at'),
+    )
+
+
+class TrackPlayCount(Base):
+    """Per-track play counter, incremented in bulk by the play buffer."""
+    __tablename__ = 'track_play_count'
+
+    track_id = Column(Integer,
+                      ForeignKey('track.id', ondelete='CASCADE'),
+                      primary_key=True)
+    plays = Column(Integer, nullable=False, default=0)
+
+
+class CatalogChange(Base):
+    """Append-only log of artist/album/track writes, replayed by the in-memory catalog snapshot."""
+    __tablename__ = 'catalog_change'
+
+    id = Column(Integer, primary_key=True)
+    entity = Column(String, nullable=False)
+    entity_id = Column(Integer, nullable=False)
@@ -0,0 +1,38 @@
+import os
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+# bcrypt cost factor; pick it with calibrate_password_hashing.py
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+
+
+def build_pwd_context(rounds: int = BCRYPT_ROUNDS) -> CryptContext:
+    # Hashes with any other cost are reported by needs_update and rehashed on login
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds
+    )
+
+
+# The single password hashing service for users and artists
+pwd_context = build_pwd_context()
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password and, if its hash was made with other settings than the
+    current ones, return a replacement hash to store.
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def get_password_hash(password: str) -> str:
+    return pwd_context.hash(password)
@@ -1,19 +1,28 @@
 from typing import List, Optional, Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 
 import models
+from datamanager.batch import get_many_by_ids
+from datamanager.catalog import record_catalog_change, catalog_snapshot, snapshot_if_ready, ALBUM
+from datamanager.catalog_filters import CatalogFilters, catalog_filters
+from datamanager.counts import count_total, set_total_count
 from datamanager.database import get_db
+from datamanager.fieldsets import Fieldset, fieldset_param, project
+from datamanager.price_cache import price_cache
 from routes.artist import get_current_active_artist
-from schemas import album_schemas
+from schemas import album_schemas, batch_schemas
 
 router = APIRouter(
     prefix="/albums",
     tags=["albums"]
 )
 
+ALBUM_EXPANSIONS = {"tracks", "artist"}
+ALBUM_DETAIL_MAX_AGE = 60
+
 
 @router.post("/", response_model=album_schemas.AlbumResponse, status_code=status.HTTP_201_CREATED)
 def create_album(
@@ -30,7 +39,10 @@ def create_album(
 
     try:
         db.add(db_album)
+        db.flush()
+        record_catalog_change(db, ALBUM, db_album.id)
         db.commit()
+        catalog_snapshot.request_refresh()
         db.refresh(db_album)
         return db_album
     except IntegrityError:
@@ -43,12 +55,32 @@ def create_album(
 
 @router.get("/", response_model=List[album_schemas.AlbumResponse])
 def get_albums(
+        response: Response,
         album_id: Optional[int] = None,
         skip: int = 0,
         limit: int = 100,
+        filters: CatalogFilters = Depends(catalog_filters),
+        fieldset: Optional[Fieldset] = Depends(fieldset_param(album_schemas.AlbumResponse)),
+        include_total: bool = Query(False, description="Send the number of matching albums in X-Total-Count"),
         db: Session = Depends(get_db)
 ):
+    snapshot = snapshot_if_ready()
+    if snapshot is not None and (album_id is not None or filters.is_default()):
+        if album_id is None:
+            if include_total:
+                set_total_count(response, snapshot.count_albums())
+            return project(snapshot.list_albums(skip, limit), fieldset, response)
+        album = snapshot.get_album(album_id)
+        if album is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Album not found"
+            )
+        return project([album], fieldset, response)
+
     query = db.query(models.Album)
+    if fieldset is not None:
+        query = query.options(fieldset.load_only(models.Album))
 
     if album_id is not None:
         album = query.filter(models.Album.id == album_id).first()
@@ -57,25 +89,113 @@ def get_albums(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Album not found"
             )
-        return [album]  # Return as a list for consistent response model
+        return project([album], fieldset, response)  # Return as a list for consistent response model
 
-    return query.offset(skip).limit(limit).all()
+    query = filters.apply(query, models.Album)
+    if include_total:
+        set_total_count(response, *count_total(db, query))
+    return project(query.offset(skip).limit(limit).all(), fieldset, response)
+
+
+@router.post("/batch", response_model=album_schemas.AlbumBatchResponse)
+def get_albums_batch(batch: batch_schemas.BatchRequest, db: Session = Depends(get_db)):
+    """
+    Resolve many albums in one query. Items follow the requested order,
+    with null in place of ids that were not found.
+    """
+    snapshot = snapshot_if_ready()
+    if snapshot is not None:
+        items = [snapshot.get_album(album_id) for album_id in batch.ids]
+        missing = list(dict.fromkeys(album_id for album_id, item in zip(batch.ids, items) if item is None))
+        return {"items": items, "missing": missing}
+
+    items, missing = get_many_by_ids(db, models.Album, batch.ids)
+    return {"items": items, "missing": missing}
+
+
+@router.get("/{album_id}", response_model=album_schemas.AlbumDetailResponse,
+            response_model_exclude_unset=True)
+def get_album_detail(
+        album_id: int,
+        response: Response,
+        expand: Optional[str] = Query(None, description="Comma separated: tracks,artist"),
+        db: Session = Depends(get_db)
+):
+    """
+    Return an album with its ordered tracks and/or artist summary embedded,
+    loaded with a single joined query.
+    """
+    expansions = {part.strip() for part in expand.split(",") if part.strip()} if expand else set()
+    unknown = expansions - ALBUM_EXPANSIONS
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown expand value(s): {', '.join(sorted(unknown))}"
+        )
+
+    snapshot = snapshot_if_ready()
+    if snapshot is not None:
+        album = snapshot.get_album(album_id)
+        tracks = snapshot.album_tracks(album_id) if "tracks" in expansions else None
+        artist = snapshot.get_artist(album.artist_id) if album and "artist" in expansions else None
+    else:
+        query = db.query(models.Album)
+        if "tracks" in expansions:
+            query = query.options(joinedload(models.Album.tracks))
+        if "artist" in expansions:
+            query = query.options(joinedload(models.Album.artist))
+        album = query.filter(models.Album.id == album_id).first()
+        tracks = album.tracks if album and "tracks" in expansions else None
+        artist = album.artist if album and "artist" in expansions else None
+
+    if album is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Album not found"
+        )
+
+    # Only requested expansions are set, so unset ones are left out while
+    # null columns such as price are still sent
+    embedded = {}
+    if "tracks" in expansions:
+        embedded["tracks"] = tracks
+    if "artist" in expansions:
+        embedded["artist"] = artist
+
+    response.headers["Cache-Control"] = f"public, max-age={ALBUM_DETAIL_MAX_AGE}"
+    return album_schemas.AlbumDetailResponse(
+        id=album.id,
+        artist_id=album.artist_id,
+        name=album.name,
+        release_date=album.release_date,
+        price=album.price,
+        **embedded
+    )
 
 
 @router.get("/{album_id}/tracks", response_model=List[album_schemas.AlbumTrackResponse])
 def get_album_tracks(album_id: int, db: Session = Depends(get_db)):
-    album = db.query(models.Album).filter(models.Album.id == album_id).first()
+    snapshot = snapshot_if_ready()
+    if snapshot is not None:
+        if snapshot.get_album(album_id) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Album not found"
+            )
+        return snapshot.album_tracks(album_id)
+
+    # Existence check and tracks come from the same joined query
+    album = (db.query(models.Album)
+             .options(joinedload(models.Album.tracks))
+             .filter(models.Album.id == album_id)
+             .first())
     if not album:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Album not found"
         )
 
-    album_tracks = db.query(models.Track).filter(models.Track.album_id == album_id).all()
-    if not album_tracks:
-        return []
-
-    return album_tracks
+    return album.tracks
 
 
 @router.put("/{album_id}", response_model=album_schemas.AlbumResponse)
@@ -105,7 +225,10 @@ def update_album(
         setattr(db_album, key, value)
 
     try:
+        record_catalog_change(db, ALBUM, album_id)
         db.commit()
+        price_cache.invalidate("album", album_id)
+        catalog_snapshot.request_refresh()
         db.refresh(db_album)
         return db_album
     except IntegrityError:
@@ -122,20 +245,28 @@ def delete_album(
         album_id: int,
         db: Session = Depends(get_db)
 ):
-    db_album = db.query(models.Album).filter(models.Album.id == album_id).first()
+    # Only the owner column is needed for the permission check
+    album_artist_id = db.query(models.Album.artist_id).filter(models.Album.id == album_id).scalar()
 
-    if current_artist.id != db_album.artist_id:
+    if album_artist_id is None:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to delete this album"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Album not found"
         )
 
-    if db_album is None:
+    if current_artist.id != album_artist_id:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Album not found"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to delete this album"
         )
 
-    db.delete(db_album)
+    track_ids = [track_id for (track_id,) in
+                 db.query(models.Track.id).filter(models.Track.album_id == album_id)]
+
+    # The album's tracks are removed by ON DELETE CASCADE in the database
+    db.query(models.Album).filter(models.Album.id == album_id).delete(synchronize_session=False)
+    record_catalog_change(db, ALBUM, album_id)
     db.commit()
+    catalog_snapshot.request_refresh()
+    price_cache.invalidate_many([("album", album_id)] + [("track", track_id) for track_id in track_ids])
     return None
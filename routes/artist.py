@@ -1,33 +1,40 @@
-from datetime import timedelta
+from datetime import date, timedelta
 from typing import List, Optional, Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from passlib.context import CryptContext
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 import models
+from datamanager.batch import get_many_by_ids
+from datamanager.catalog import record_catalog_change, catalog_snapshot, ARTIST
+from datamanager.counts import count_total, set_total_count
 from datamanager.database import get_db
-from routes.user import get_current_admin_user
-from schemas import artist_schemas
+from datamanager.fieldsets import Fieldset, fieldset_param, project
+from datamanager.price_cache import price_cache
+from datamanager.revocation import revocation_list
+from datamanager.recommendations import co_follow_index
+from routes.user import get_current_admin_user, get_current_active_user
+from schemas import artist_schemas, batch_schemas
 from schemas.artist_schemas import ArtistRole
-from auth_utils import verify_password, create_access_token, get_current_entity, ACCESS_TOKEN_EXPIRE_MINUTES
+from auth_utils import (
+    verify_and_update_password,
+    get_password_hash,
+    create_access_token,
+    get_current_entity,
+    load_entity,
+    ACCESS_TOKEN_EXPIRE_MINUTES
+)
 
 router = APIRouter(
     prefix="/artists",
     tags=["artists"]
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_artist_scheme = OAuth2PasswordBearer(tokenUrl="artists/token", scheme_name="ArtistAuth")
 
 
-# Security utility functions
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-
 async def get_current_artist(
     token: Annotated[str, Depends(oauth2_artist_scheme)],
     db: Session = Depends(get_db)
@@ -50,17 +57,25 @@ async def login_for_access_token(
     db: Session = Depends(get_db)
 ) -> artist_schemas.Token:
     artist = db.query(models.Artist).filter(models.Artist.username == form_data.username).first()
-    if not artist or not verify_password(form_data.password, artist.password):
+    verified, new_hash = (verify_and_update_password(form_data.password, artist.password)
+                          if artist else (False, None))
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    if new_hash:
+        # Upgrade hashes made with an older cost setting
+        artist.password = new_hash
+        db.commit()
+
     access_token = create_access_token(
         data={"sub": artist.id},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
-        token_type="artist"
+        token_type="artist",
+        entity=artist
     )
     return artist_schemas.Token(access_token=access_token, token_type="bearer")
 
@@ -82,7 +97,10 @@ def create_artist(artist: artist_schemas.ArtistCreate, db: Session = Depends(get
 
     try:
         db.add(db_artist)
+        db.flush()
+        record_catalog_change(db, ARTIST, db_artist.id)
         db.commit()
+        catalog_snapshot.request_refresh()
         db.refresh(db_artist)
         return db_artist
     except IntegrityError:
@@ -94,21 +112,58 @@ def create_artist(artist: artist_schemas.ArtistCreate, db: Session = Depends(get
 
 
 @router.get("/me", response_model=artist_schemas.ArtistResponse)
-async def read_artists_me(
-        current_artist: Annotated[models.Artist, Depends(get_current_active_artist)]
+def read_artists_me(
+        current_artist: Annotated[models.Artist, Depends(get_current_active_artist)],
+        db: Session = Depends(get_db)
 ):
-    return current_artist
+    return load_entity(db, current_artist)
+
+
+@router.get("/me/sales", response_model=artist_schemas.ArtistSalesResponse)
+def read_artists_me_sales(
+        current_artist: Annotated[models.Artist, Depends(get_current_active_artist)],
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        db: Session = Depends(get_db)
+):
+    """
+    Per-day and per-item revenue and units, read from the sales rollup tables.
+    """
+    daily_query = db.query(models.ArtistSalesDaily).filter(
+        models.ArtistSalesDaily.artist_id == current_artist.id
+    )
+    if start is not None:
+        daily_query = daily_query.filter(models.ArtistSalesDaily.day >= start)
+    if end is not None:
+        daily_query = daily_query.filter(models.ArtistSalesDaily.day <= end)
+
+    items = (
+        db.query(models.ArtistSalesItem)
+        .filter(models.ArtistSalesItem.artist_id == current_artist.id)
+        .order_by(models.ArtistSalesItem.revenue.desc())
+        .all()
+    )
+
+    return {
+        "daily": daily_query.order_by(models.ArtistSalesDaily.day).all(),
+        "items": items
+    }
 
 
 @router.get("/", response_model=List[artist_schemas.ArtistResponse])
 def get_artists(
+        response: Response,
         current_user: Annotated[models.User, Depends(get_current_admin_user)],
         artist_id: Optional[int] = None,
         skip: int = 0,
         limit: int = 100,
+        fieldset: Optional[Fieldset] = Depends(fieldset_param(artist_schemas.ArtistResponse)),
+        include_total: bool = Query(False, description="Send the number of artists in X-Total-Count"),
         db: Session = Depends(get_db)
 ):
     query = db.query(models.Artist)
+    if fieldset is not None:
+        query = query.options(fieldset.load_only(models.Artist))
 
     if artist_id is not None:
         artist = query.filter(models.Artist.id == artist_id).first()
@@ -117,9 +172,94 @@ def get_artists(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Artist not found"
             )
-        return [artist]
+        return project([artist], fieldset, response)
+
+    if include_total:
+        set_total_count(response, *count_total(db, query))
+    return project(query.offset(skip).limit(limit).all(), fieldset, response)
+
+
+@router.post("/batch", response_model=artist_schemas.ArtistBatchResponse)
+def get_artists_batch(
+        current_user: Annotated[models.User, Depends(get_current_admin_user)],
+        batch: batch_schemas.BatchRequest,
+        db: Session = Depends(get_db)
+):
+    """
+    Resolve many artists in one query. Items follow the requested order,
+    with null in place of ids that were not found.
+    """
+    items, missing = get_many_by_ids(db, models.Artist, batch.ids)
+    return {"items": items, "missing": missing}
+
+
+@router.get("/{artist_id}/similar", response_model=List[artist_schemas.SimilarArtistResponse])
+def get_similar_artists(
+        artist_id: int,
+        limit: int = Query(10, ge=1, le=50),
+        db: Session = Depends(get_db)
+):
+    """
+    Artists whose followers also follow this artist, ranked by co-follow similarity.
+    """
+    neighbours = co_follow_index.similar(db, artist_id, limit)
+    if not neighbours:
+        return []
+
+    artists = {
+        artist.id: artist for artist in
+        db.query(models.Artist.id, models.Artist.name, models.Artist.genre)
+        .filter(models.Artist.id.in_([neighbour_id for neighbour_id, _ in neighbours]))
+        .all()
+    }
+    return [
+        {"id": neighbour_id, "name": artists[neighbour_id].name,
+         "genre": artists[neighbour_id].genre, "score": score}
+        for neighbour_id, score in neighbours if neighbour_id in artists
+    ]
+
+
+@router.post("/{artist_id}/follow", status_code=status.HTTP_204_NO_CONTENT)
+def follow_artist(
+        artist_id: int,
+        current_user: Annotated[models.User, Depends(get_current_active_user)],
+        db: Session = Depends(get_db)
+):
+    db_follower = models.Follower(user_id=current_user.id, artist_id=artist_id)
+
+    try:
+        db.add(db_follower)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Artist not found or already followed"
+        )
+
+    co_follow_index.record_follow(db, current_user.id, artist_id, 1)
+    return None
 
-    return query.offset(skip).limit(limit).all()
+
+@router.delete("/{artist_id}/follow", status_code=status.HTTP_204_NO_CONTENT)
+def unfollow_artist(
+        artist_id: int,
+        current_user: Annotated[models.User, Depends(get_current_active_user)],
+        db: Session = Depends(get_db)
+):
+    deleted = (db.query(models.Follower)
+               .filter(models.Follower.user_id == current_user.id,
+                       models.Follower.artist_id == artist_id)
+               .delete(synchronize_session=False))
+    if not deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Artist not followed"
+        )
+
+    db.commit()
+    co_follow_index.record_follow(db, current_user.id, artist_id, -1)
+    return None
 
 
 @router.put("/{artist_id}", response_model=artist_schemas.ArtistResponse)
@@ -151,8 +291,13 @@ def update_artist(
         setattr(db_artist, key, value)
 
     try:
+        record_catalog_change(db, ARTIST, artist_id)
         db.commit()
+        catalog_snapshot.request_refresh()
         db.refresh(db_artist)
+        # Tokens carrying the old role or credentials must stop working
+        if "role" in update_data or "password" in update_data:
+            revocation_list.revoke_subject("artist", artist_id)
         return db_artist
     except IntegrityError:
         db.rollback()
@@ -174,13 +319,20 @@ def delete_artist(
             detail="Not authorized to delete this artist"
         )
 
-    db_artist = db.query(models.Artist).filter(models.Artist.id == artist_id).first()
-    if db_artist is None:
+    # Single DELETE statement, tracks, albums and followers are removed by ON DELETE CASCADE
+    deleted = (db.query(models.Artist)
+               .filter(models.Artist.id == artist_id)
+               .delete(synchronize_session=False))
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Artist not found"
         )
 
-    db.delete(db_artist)
+    record_catalog_change(db, ARTIST, artist_id)
     db.commit()
+    revocation_list.revoke_subject("artist", artist_id)
+    # The artist's albums and tracks went with it
+    price_cache.clear()
+    catalog_snapshot.request_refresh()
     return None
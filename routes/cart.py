@@ -0,0 +1,153 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+from datamanager.cart import CartFullError, MAX_CART_LINES, get_cart_store
+from datamanager.database import get_db
+from datamanager.jobs import enqueue, PROCESS_ORDER
+from routes.order_item import get_item_prices, calculate_subtotal
+from routes.user import get_current_active_user
+from schemas import cart_schemas, order_schemas
+
+router = APIRouter(
+    prefix="/cart",
+    tags=["cart"]
+)
+
+
+def cart_response(lines) -> dict:
+    for line in lines:
+        line["subtotal"] = calculate_subtotal(line["quantity"], line["price"])
+    return {"lines": lines, "total": sum(line["subtotal"] for line in lines)}
+
+
+@router.get("/", response_model=cart_schemas.CartResponse)
+def read_cart(
+        current_user: Annotated[models.User, Depends(get_current_active_user)]
+):
+    """The current user's cart, with the prices seen when each line was added."""
+    return cart_response(get_cart_store().get_lines(current_user.id))
+
+
+@router.put("/items", response_model=cart_schemas.CartResponse)
+def set_cart_line(
+        current_user: Annotated[models.User, Depends(get_current_active_user)],
+        line: cart_schemas.CartLineSet,
+        db: Session = Depends(get_db)
+):
+    """Add an item to the cart, or set its quantity if it is already there."""
+    price = get_item_prices(db, [(line.type, line.item_id)])[(line.type, line.item_id)]
+    if price is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Item not found"
+        )
+
+    store = get_cart_store()
+    try:
+        store.set_line(current_user.id, line.type, line.item_id, line.quantity, price)
+    except CartFullError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A cart can hold at most {MAX_CART_LINES} items"
+        )
+    return cart_response(store.get_lines(current_user.id))
+
+
+@router.delete("/items/{item_type}/{item_id}", response_model=cart_schemas.CartResponse)
+def remove_cart_line(
+        current_user: Annotated[models.User, Depends(get_current_active_user)],
+        item_type: str,
+        item_id: int
+):
+    store = get_cart_store()
+    if not store.remove_line(current_user.id, item_type, item_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Item not in cart"
+        )
+    return cart_response(store.get_lines(current_user.id))
+
+
+@router.delete("/", status_code=status.HTTP_204_NO_CONTENT)
+def clear_cart(
+        current_user: Annotated[models.User, Depends(get_current_active_user)]
+):
+    get_cart_store().clear(current_user.id)
+
+
+@router.post("/checkout", response_model=order_schemas.OrderWithItemsResponse,
+             status_code=status.HTTP_201_CREATED)
+def checkout_cart(
+        current_user: Annotated[models.User, Depends(get_current_active_user)],
+        checkout: cart_schemas.CartCheckout,
+        db: Session = Depends(get_db)
+):
+    """
+    Turn the cart into an order with its items and queue it for processing,
+    all in one transaction. Items are charged at their current price.
+    """
+    store = get_cart_store()
+    lines = store.get_lines(current_user.id)
+    if not lines:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cart is empty"
+        )
+
+    payment_method = (
+        db.query(models.UserPaymentMethod.id)
+        .filter(models.UserPaymentMethod.id == checkout.payment_method_id,
+                models.UserPaymentMethod.user_id == current_user.id)
+        .first()
+    )
+    if payment_method is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Bad payment method id"
+        )
+
+    prices = get_item_prices(db, [(line["type"], line["item_id"]) for line in lines])
+    missing = [line for line in lines if prices[(line["type"], line["item_id"])] is None]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Some cart items are no longer available"
+        )
+
+    db_items = []
+    for line in lines:
+        price = prices[(line["type"], line["item_id"])]
+        db_items.append(models.OrderItem(
+            item_id=line["item_id"],
+            type=line["type"],
+            quantity=line["quantity"],
+            price=price,
+            subtotal=calculate_subtotal(line["quantity"], price)
+        ))
+    db_order = models.Order(
+        user_id=current_user.id,
+        payment_method_id=checkout.payment_method_id,
+        total=sum(db_item.subtotal for db_item in db_items),
+        items=db_items
+    )
+
+    try:
+        db.add(db_order)
+        # process_order grants ownership and counts the sales once the order completes
+        db.flush()
+        enqueue(db, PROCESS_ORDER, db_order.id)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Bad request, check input"
+        )
+
+    store.clear(current_user.id)
+    db.refresh(db_order)
+    return db_order
@@ -1,19 +1,45 @@
-from typing import List, Optional, Annotated
+import base64
+from datetime import datetime
+from typing import List, Optional, Annotated, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import func, tuple_
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 
 import models
 from datamanager.database import get_db
+from datamanager.entitlements import grant_for_order, revoke_for_order
+from datamanager.jobs import enqueue, PROCESS_ORDER
+from datamanager.sales import apply_order_sales, remove_order_sales
+from routes.order_item import get_item_prices, calculate_subtotal
 from routes.user import get_current_active_user, get_current_admin_user
-from schemas import order_schemas
+from schemas import order_schemas, order_items_schemas
+from schemas.user_schemas import UserRole
 
 router = APIRouter(
     prefix="/orders",
     tags=["orders"]
 )
 
+ORDER_EXPANSIONS = {"items", "summary"}
+
+
+def encode_order_cursor(order: models.Order) -> str:
+    raw = f"{order.order_date.isoformat()}|{order.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_order_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        order_date, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(order_date), int(order_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
 
 @router.post("/", response_model=order_schemas.OrderResponse, status_code=status.HTTP_201_CREATED)
 def create_order(
@@ -62,19 +88,247 @@ def get_orders(
     return query.offset(skip).limit(limit).all()
 
 
-@router.get("/me", response_model=List[order_schemas.OrderResponse])
-async def read_orders_me(
+@router.get("/me", response_model=List[order_schemas.OrderHistoryResponse],
+            response_model_exclude_unset=True)
+def read_orders_me(
         current_user: Annotated[models.User, Depends(get_current_active_user)],
+        response: Response,
+        limit: int = Query(20, ge=1, le=100),
+        cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+        expand: Optional[str] = Query(None, description="Comma separated: items,summary"),
         db: Session = Depends(get_db)
 ):
-    user_orders = (
-        db.query(models.Order)
-        .filter(models.Order.user_id == current_user.id).all()
+    """
+    The current user's orders, newest first, a page at a time. Items and
+    per-order item summaries are embedded on request, each with one query
+    for the whole page. The next page's cursor is sent in X-Next-Cursor.
+    """
+    expansions = {part.strip() for part in expand.split(",") if part.strip()} if expand else set()
+    unknown = expansions - ORDER_EXPANSIONS
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown expand value(s): {', '.join(sorted(unknown))}"
+        )
+
+    query = db.query(models.Order).filter(models.Order.user_id == current_user.id)
+    if cursor is not None:
+        query = query.filter(
+            tuple_(models.Order.order_date, models.Order.id) < tuple_(*decode_order_cursor(cursor))
+        )
+    if "items" in expansions:
+        query = query.options(selectinload(models.Order.items))
+
+    # One extra row tells whether there is a next page
+    orders = (query
+              .order_by(models.Order.order_date.desc(), models.Order.id.desc())
+              .limit(limit + 1)
+              .all())
+    if len(orders) > limit:
+        orders = orders[:limit]
+        response.headers["X-Next-Cursor"] = encode_order_cursor(orders[-1])
+
+    summaries = {}
+    if "summary" in expansions and orders:
+        summaries = {
+            order_id: (item_count, units) for order_id, item_count, units in
+            db.query(models.OrderItem.order_id,
+                     func.count(models.OrderItem.id),
+                     func.sum(models.OrderItem.quantity))
+            .filter(models.OrderItem.order_id.in_([order.id for order in orders]))
+            .group_by(models.OrderItem.order_id)
+        }
+
+    # Only requested expansions are set, so unset ones are left out while
+    # null columns such as an item's price are still sent
+    history = []
+    for order in orders:
+        embedded = {}
+        if "items" in expansions:
+            embedded["items"] = order.items
+        if "summary" in expansions:
+            embedded["item_count"], embedded["units"] = summaries.get(order.id, (0, 0))
+        history.append(order_schemas.OrderHistoryResponse(
+            id=order.id,
+            user_id=order.user_id,
+            payment_method_id=order.payment_method_id,
+            status=order.status,
+            order_date=order.order_date,
+            total=order.total,
+            **embedded
+        ))
+    return history
+
+
+@router.post("/{order_id}/checkout", response_model=order_schemas.OrderResponse,
+             status_code=status.HTTP_202_ACCEPTED)
+def checkout_order(
+        current_user: Annotated[models.User, Depends(get_current_active_user)],
+        order_id: int,
+        db: Session = Depends(get_db)
+):
+    """
+    Queue the order for processing. The background worker (worker.py)
+    completes it and runs the post-purchase steps.
+    """
+    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    if db_order is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Order not found"
+        )
+
+    if current_user.id != db_order.user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to check out this order"
+        )
+
+    if db_order.status != "Processing":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Order is already {db_order.status}"
+        )
+
+    already_queued = (
+        db.query(models.Job.id)
+        .filter(models.Job.order_id == order_id,
+                models.Job.kind == PROCESS_ORDER,
+                models.Job.status.in_(("queued", "running")))
+        .first()
     )
-    if not user_orders:
-        return []
+    if already_queued is None:
+        enqueue(db, PROCESS_ORDER, order_id)
+        db.commit()
+        db.refresh(db_order)
+
+    return db_order
 
-    return user_orders
+
+@router.patch("/{order_id}/items", response_model=order_schemas.OrderWithItemsResponse)
+def patch_order_items(
+        current_user: Annotated[models.User, Depends(get_current_active_user)],
+        order_id: int,
+        patch: order_items_schemas.OrderItemsPatch,
+        db: Session = Depends(get_db)
+):
+    """
+    Apply several item additions, edits and removals to an order in one
+    transaction. Prices of changed items are resolved together and the
+    order total is recomputed once.
+    """
+    db_order = (db.query(models.Order)
+                .options(selectinload(models.Order.items))
+                .filter(models.Order.id == order_id)
+                .first())
+    if db_order is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Order not found"
+        )
+
+    if current_user.id != db_order.user_id and current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to modify this order"
+        )
+
+    # Same rule as checkout: only orders still being assembled can change
+    if db_order.status != "Processing":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Order is already {db_order.status}"
+        )
+
+    items_by_id = {item.id: item for item in db_order.items}
+    deletes = set(patch.deletes)
+    updated_ids = [upsert.id for upsert in patch.upserts if upsert.id is not None]
+    unknown = (set(updated_ids) | deletes) - items_by_id.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Order item(s) not found: {', '.join(map(str, sorted(unknown)))}"
+        )
+    if deletes & set(updated_ids) or len(updated_ids) != len(set(updated_ids)):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Each order item can only be changed once per request"
+        )
+    if any(value is None
+           for upsert in patch.upserts if upsert.id is not None
+           for value in upsert.dict(exclude_unset=True).values()):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="item_id, type and quantity of existing order items can't be null"
+        )
+
+    # Collect every (type, item_id) whose price is needed, then resolve them together
+    price_keys = []
+    for upsert in patch.upserts:
+        if upsert.id is None:
+            if upsert.item_id is None or upsert.type is None or upsert.quantity is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="New order items need item_id, type and quantity"
+                )
+            price_keys.append((upsert.type, upsert.item_id))
+        elif upsert.item_id is not None or upsert.type is not None:
+            existing = items_by_id[upsert.id]
+            price_keys.append((
+                upsert.type if upsert.type is not None else existing.type,
+                upsert.item_id if upsert.item_id is not None else existing.item_id
+            ))
+
+    prices = get_item_prices(db, price_keys)
+    if any(price is None for price in prices.values()):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Item not found"
+        )
+
+    try:
+        for order_item_id in deletes:
+            db.delete(items_by_id[order_item_id])
+
+        created = []
+        for upsert in patch.upserts:
+            if upsert.id is None:
+                price = prices[(upsert.type, upsert.item_id)]
+                db_item = models.OrderItem(
+                    order_id=order_id,
+                    item_id=upsert.item_id,
+                    type=upsert.type,
+                    quantity=upsert.quantity,
+                    price=price,
+                    subtotal=calculate_subtotal(upsert.quantity, price)
+                )
+                db.add(db_item)
+                created.append(db_item)
+                continue
+
+            db_item = items_by_id[upsert.id]
+            update_data = upsert.dict(exclude_unset=True, exclude={"id"})
+            if not update_data:
+                continue
+            for key, value in update_data.items():
+                setattr(db_item, key, value)
+            if "item_id" in update_data or "type" in update_data:
+                db_item.price = prices[(db_item.type, db_item.item_id)]
+            db_item.subtotal = calculate_subtotal(db_item.quantity, db_item.price)
+
+        # Ownership and sales follow when the order completes, so none are recorded here
+        remaining = [item for item_id, item in items_by_id.items() if item_id not in deletes] + created
+        db_order.total = sum(item.subtotal or 0.0 for item in remaining)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Bad request, check input"
+        )
+
+    db.refresh(db_order)
+    return db_order
 
 
 @router.put("/{order_id}", response_model=order_schemas.OrderResponse)
@@ -101,10 +355,21 @@ def update_order(
 
     update_data = order.dict(exclude_unset=True)
 
+    # Entitlements and sales rollups only cover Completed orders, so they
+    # follow the order in and out of that status
+    was_completed = db_order.status == "Completed"
+    if was_completed and update_data.get("status", "Completed") != "Completed":
+        revoke_for_order(db, order_id)
+        remove_order_sales(db, order_id)
+
     for key, value in update_data.items():
         setattr(db_order, key, value)
 
     try:
+        if not was_completed and db_order.status == "Completed":
+            db.flush()
+            grant_for_order(db, order_id)
+            apply_order_sales(db, order_id)
         db.commit()
         db.refresh(db_order)
         return db_order
@@ -123,20 +388,23 @@ def delete_order(
         order_id: int,
         db: Session = Depends(get_db)
 ):
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    # Only the owner column is needed for the permission check
+    order_user_id = db.query(models.Order.user_id).filter(models.Order.id == order_id).scalar()
 
-    if current_user.id != db_order.user_id or current_user.role != "admin":
+    if order_user_id is None:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to modify this order"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Order not found"
         )
 
-    if db_order is None:
+    if current_user.id != order_user_id or current_user.role != "admin":
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to modify this order"
         )
 
-    db.delete(db_order)
+    # The order's items are removed by ON DELETE CASCADE in the database
+    remove_order_sales(db, order_id)
+    db.query(models.Order).filter(models.Order.id == order_id).delete(synchronize_session=False)
     db.commit()
     return None
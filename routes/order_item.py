@@ -1,4 +1,4 @@
-from typing import List, Annotated
+from typing import Dict, Iterable, List, Annotated, Optional, Tuple
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.exc import IntegrityError
@@ -6,6 +6,9 @@ from sqlalchemy.orm import Session
 
 import models
 from datamanager.database import get_db
+from datamanager.entitlements import grant_for_order_item, refresh_for_order_item
+from datamanager.price_cache import price_cache
+from datamanager.sales import apply_sale
 from routes.user import get_current_admin_user, get_current_active_user
 from schemas import order_items_schemas, order_schemas
 
@@ -15,12 +18,23 @@ router = APIRouter(
 )
 
 
-def get_item_price(db: Session, item_id: int, item_type: str) -> float:
-    if item_type == "track":
-        return db.query(models.Track.price).filter(models.Track.id == item_id).scalar()
-    elif item_type == "album":
-        return db.query(models.Album.price).filter(models.Album.id == item_id).scalar()
-    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid item type")
+def get_item_price(db: Session, item_id: int, item_type: str) -> Optional[float]:
+    return get_item_prices(db, [(item_type, item_id)])[(item_type, item_id)]
+
+
+def get_item_prices(
+        db: Session,
+        items: Iterable[Tuple[str, int]]
+) -> Dict[Tuple[str, int], Optional[float]]:
+    """
+    Resolve the prices of many (type, item_id) pairs through the price cache,
+    reading all misses with a single query. Items that don't exist map to None.
+    """
+    items = set(items)
+    invalid_types = {item_type for item_type, _ in items} - {"track", "album"}
+    if invalid_types:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid item type")
+    return price_cache.get_many(db, items)
 
 
 def calculate_subtotal(quantity: int, price: float) -> float:
@@ -53,6 +67,10 @@ def create_order_item(
 
     try:
         db.add(db_order_item)
+        db.flush()
+        grant_for_order_item(db, db_order_item.id)
+        apply_sale(db, db_order_item.order_id, db_order_item.item_id, db_order_item.type,
+                   db_order_item.quantity, db_order_item.subtotal)
         db.commit()
         db.refresh(db_order_item)
 
@@ -118,6 +136,8 @@ def update_order_item(
         )
 
     update_data = order_item.dict(exclude_unset=True)
+    previous_sale = (db_order_item.item_id, db_order_item.type,
+                     db_order_item.quantity, db_order_item.subtotal)
 
     # Update price and subtotal if item_id or type is changed
     if "item_id" in update_data or "type" in update_data:
@@ -134,6 +154,14 @@ def update_order_item(
         setattr(db_order_item, key, value)
 
     try:
+        if "item_id" in update_data or "type" in update_data:
+            db.flush()
+            refresh_for_order_item(db, db_order_item.id)
+        if update_data:
+            # Swap the item's old contribution to the sales rollups for the new one
+            apply_sale(db, db_order_item.order_id, *previous_sale, sign=-1)
+            apply_sale(db, db_order_item.order_id, db_order_item.item_id, db_order_item.type,
+                       db_order_item.quantity, db_order_item.subtotal)
         db.commit()
         db.refresh(db_order_item)
 
@@ -174,6 +202,8 @@ def delete_order_item(
             detail="Order item not found"
         )
 
+    apply_sale(db, db_order_item.order_id, db_order_item.item_id, db_order_item.type,
+               db_order_item.quantity, db_order_item.subtotal, sign=-1)
     db.delete(db_order_item)
     db.commit()
 
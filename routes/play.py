@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+from typing import List, Annotated
+
+from fastapi import APIRouter, Depends, Query, status
+from sqlalchemy.orm import Session
+
+import models
+from datamanager.database import get_db
+from datamanager.plays import play_buffer
+from routes.user import get_current_active_user, get_current_admin_user
+from schemas import play_schemas
+
+router = APIRouter(
+    prefix="/plays",
+    tags=["plays"]
+)
+
+
+def _played_at(play: play_schemas.PlayCreate) -> datetime:
+    played_at = play.played_at or datetime.now(timezone.utc)
+    if played_at.tzinfo is not None:
+        played_at = played_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return played_at
+
+
+@router.post("/", response_model=play_schemas.PlayAccepted, status_code=status.HTTP_202_ACCEPTED)
+async def record_play(
+        current_user: Annotated[models.User, Depends(get_current_active_user)],
+        play: play_schemas.PlayCreate
+):
+    play_buffer.add(current_user.id, play.track_id, _played_at(play))
+    return {"accepted": 1}
+
+
+@router.post("/batch", response_model=play_schemas.PlayAccepted, status_code=status.HTTP_202_ACCEPTED)
+async def record_plays(
+        current_user: Annotated[models.User, Depends(get_current_active_user)],
+        batch: play_schemas.PlayBatchCreate
+):
+    for play in batch.plays:
+        play_buffer.add(current_user.id, play.track_id, _played_at(play))
+    return {"accepted": len(batch.plays)}
+
+
+@router.get("/recent", response_model=List[play_schemas.PlayResponse])
+def read_recent_plays(
+        current_user: Annotated[models.User, Depends(get_current_active_user)],
+        limit: int = Query(20, ge=1, le=100),
+        db: Session = Depends(get_db)
+):
+    """
+    The current user's most recent plays, including ones not flushed yet.
+    """
+    flushed = (
+        db.query(models.Play.track_id, models.Play.played_at)
+        .filter(models.Play.user_id == current_user.id)
+        .order_by(models.Play.played_at.desc())
+        .limit(limit)
+        .all()
+    )
+    pending = play_buffer.pending_for_user(current_user.id)
+
+    plays = [{"track_id": row["track_id"], "played_at": row["played_at"]} for row in pending]
+    plays += [{"track_id": track_id, "played_at": played_at} for track_id, played_at in flushed]
+    plays.sort(key=lambda play: play["played_at"], reverse=True)
+    return plays[:limit]
+
+
+@router.get("/metrics", response_model=play_schemas.PlayBufferMetrics)
+def read_play_buffer_metrics(
+        current_user: Annotated[models.User, Depends(get_current_admin_user)]
+):
+    return play_buffer.metrics()
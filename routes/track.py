@@ -1,13 +1,40 @@
+import os
 from typing import List, Optional, Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from pydantic import ValidationError
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 import models
+from datamanager.audio_storage import (
+    receive_upload,
+    upload_slots,
+    MalformedUploadError,
+    UploadTooLargeError,
+    UnsupportedAudioTypeError,
+    MAX_FORM_FIELD_BYTES,
+    MAX_UPLOAD_BYTES
+)
+from datamanager.batch import get_many_by_ids
+from datamanager.catalog import record_catalog_change, catalog_snapshot, snapshot_if_ready, TRACK
+from datamanager.catalog_filters import CatalogFilters, catalog_filters
+from datamanager.counts import count_total, set_total_count
 from datamanager.database import get_db
+from datamanager.fieldsets import Fieldset, fieldset_param, project
+from datamanager.entitlements import grant_for_album_track, refresh_for_album_track
+from datamanager.peaks import (
+    get_peaks,
+    MalformedAudioError,
+    schedule_peaks,
+    UnsupportedAudioError,
+    DEFAULT_BUCKETS,
+    MAX_BUCKETS
+)
+from datamanager.price_cache import price_cache
 from routes.artist import get_current_active_artist, get_current_admin_user
-from schemas import track_schemas
+from schemas import track_schemas, batch_schemas
 
 router = APIRouter(
     prefix="/tracks",
@@ -15,6 +42,32 @@ router = APIRouter(
 )
 
 
+def save_new_track(db: Session, db_track: models.Track) -> models.Track:
+    try:
+        db.add(db_track)
+        db.flush()
+        # Buyers of the album also own tracks added to it later
+        grant_for_album_track(db, db_track.id)
+        record_catalog_change(db, TRACK, db_track.id)
+        db.commit()
+        catalog_snapshot.request_refresh()
+        db.refresh(db_track)
+        schedule_peaks(db_track.path)
+        return db_track
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Bad request, check input"
+        )
+
+
+def remove_unreferenced_audio(db: Session, path: str) -> None:
+    """Delete a stored upload whose track row was not saved, unless another track uses the same content."""
+    if db.query(models.Track.id).filter(models.Track.path == path).first() is None and os.path.exists(path):
+        os.remove(path)
+
+
 @router.post("/", response_model=track_schemas.TrackResponse, status_code=status.HTTP_201_CREATED)
 def create_track(
         current_artist: Annotated[models.Artist, Depends(get_current_active_artist)],
@@ -31,25 +84,110 @@ def create_track(
         path=track.path
     )
 
+    return save_new_track(db, db_track)
+
+
+@router.post("/upload", response_model=track_schemas.TrackResponse, status_code=status.HTTP_201_CREATED)
+async def upload_track(
+        current_artist: Annotated[models.Artist, Depends(get_current_active_artist)],
+        request: Request,
+        db: Session = Depends(get_db),
+):
+    """
+    Create a track from a multipart upload with the form fields artist_id,
+    album_id, name, release_date, price and the audio in `file`.
+    The audio is streamed to disk and stored under its content hash, so
+    uploading the same file again only adds the track row.
+    """
+    content_length = request.headers.get("content-length")
     try:
-        db.add(db_track)
-        db.commit()
-        db.refresh(db_track)
-        return db_track
-    except IntegrityError:
-        db.rollback()
+        declared_size = int(content_length) if content_length else None
+    except ValueError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Bad request, check input"
+            detail="Invalid Content-Length header"
+        )
+    if declared_size is not None and declared_size > MAX_UPLOAD_BYTES + MAX_FORM_FIELD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes"
+        )
+
+    # Reject before reading the body so large uploads can't pile up on a worker
+    if upload_slots.locked():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many uploads in progress, try again later",
+            headers={"Retry-After": "5"}
+        )
+
+    async with upload_slots:
+        try:
+            fields, staged = await receive_upload(request)
+        except UploadTooLargeError as error:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(error)
+            )
+        except UnsupportedAudioTypeError as error:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=str(error)
+            )
+        except MalformedUploadError as error:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(error)
+            )
+
+    try:
+        track = track_schemas.TrackUpload(**fields)
+    except ValidationError as error:
+        staged.discard()
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=error.errors(include_url=False, include_context=False)
         )
+    path = await run_in_threadpool(staged.store)
+
+    db_track = models.Track(path=path, **track.dict())
+    try:
+        return await run_in_threadpool(save_new_track, db, db_track)
+    except Exception:
+        if staged.created:
+            await run_in_threadpool(remove_unreferenced_audio, db, path)
+        raise
 
 
 @router.get("/", response_model=List[track_schemas.TrackResponse])
 def get_tracks(
+        response: Response,
         track_id: Optional[int] = None, skip: int = 0, limit: int = 100,
+        album_id: Optional[int] = None,
+        filters: CatalogFilters = Depends(catalog_filters),
+        fieldset: Optional[Fieldset] = Depends(fieldset_param(track_schemas.TrackResponse)),
+        include_total: bool = Query(False, description="Send the number of matching tracks in X-Total-Count"),
         db: Session = Depends(get_db)
 ):
+    snapshot = snapshot_if_ready()
+    if snapshot is not None and (track_id is not None or filters.is_default()):
+        if track_id is None:
+            if include_total:
+                set_total_count(response, snapshot.count_tracks(album_id))
+            if album_id is not None:
+                return project(snapshot.album_tracks(album_id)[skip:skip + limit], fieldset, response)
+            return project(snapshot.list_tracks(skip, limit), fieldset, response)
+        track = snapshot.get_track(track_id)
+        if track is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Track not found"
+            )
+        return project([track], fieldset, response)
+
     query = db.query(models.Track)
+    if fieldset is not None:
+        query = query.options(fieldset.load_only(models.Track))
 
     if track_id is not None:
         track = query.filter(models.Track.id == track_id).first()
@@ -58,9 +196,67 @@ def get_tracks(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Track not found"
             )
-        return [track]  # Return as a list for consistent response model
+        return project([track], fieldset, response)  # Return as a list for consistent response model
+
+    if album_id is not None:
+        query = query.filter(models.Track.album_id == album_id)
+    query = filters.apply(query, models.Track)
+    if include_total:
+        set_total_count(response, *count_total(db, query))
+    return project(query.offset(skip).limit(limit).all(), fieldset, response)
 
-    return query.offset(skip).limit(limit).all()
+
+@router.post("/batch", response_model=track_schemas.TrackBatchResponse)
+def get_tracks_batch(batch: batch_schemas.BatchRequest, db: Session = Depends(get_db)):
+    """
+    Resolve many tracks in one query. Items follow the requested order,
+    with null in place of ids that were not found.
+    """
+    snapshot = snapshot_if_ready()
+    if snapshot is not None:
+        items = [snapshot.get_track(track_id) for track_id in batch.ids]
+        missing = list(dict.fromkeys(track_id for track_id, item in zip(batch.ids, items) if item is None))
+        return {"items": items, "missing": missing}
+
+    items, missing = get_many_by_ids(db, models.Track, batch.ids)
+    return {"items": items, "missing": missing}
+
+
+@router.get("/{track_id}/peaks", response_model=track_schemas.TrackPeaksResponse)
+def get_track_peaks(
+        track_id: int,
+        buckets: int = Query(DEFAULT_BUCKETS, ge=1, le=MAX_BUCKETS),
+        db: Session = Depends(get_db)
+):
+    """
+    Min/max waveform peaks of the track's audio, split into `buckets` bins.
+    """
+    track_path = db.query(models.Track.path).filter(models.Track.id == track_id).scalar()
+    if track_path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Track not found"
+        )
+
+    try:
+        peaks = get_peaks(track_path, buckets)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Audio file not found"
+        )
+    except MalformedAudioError as error:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(error)
+        )
+    except UnsupportedAudioError as error:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=str(error)
+        )
+
+    return {"track_id": track_id, "buckets": len(peaks["min"]), **peaks}
 
 
 @router.put("/{track_id}", response_model=track_schemas.TrackResponse)
@@ -90,7 +286,13 @@ def update_track(
         setattr(db_track, key, value)
 
     try:
+        if "album_id" in update_data:
+            db.flush()
+            refresh_for_album_track(db, db_track.id)
+        record_catalog_change(db, TRACK, track_id)
         db.commit()
+        price_cache.invalidate("track", track_id)
+        catalog_snapshot.request_refresh()
         db.refresh(db_track)
         return db_track
     except IntegrityError:
@@ -108,20 +310,25 @@ def delete_track(
         track_id: int,
         db: Session = Depends(get_db)
 ):
-    db_track = db.query(models.Track).filter(models.Track.id == track_id).first()
+    # Only the owner column is needed for the permission check
+    track_artist_id = db.query(models.Track.artist_id).filter(models.Track.id == track_id).scalar()
 
-    if db_track.artist_id != current_artist.id or current_user.role != "admin":
+    if track_artist_id is None:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to delete this track"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Track not found"
         )
 
-    if db_track is None:
+    if track_artist_id != current_artist.id or current_user.role != "admin":
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Track not found"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to delete this track"
         )
 
-    db.delete(db_track)
+    # Dependent rows are removed by ON DELETE CASCADE in the database
+    db.query(models.Track).filter(models.Track.id == track_id).delete(synchronize_session=False)
+    record_catalog_change(db, TRACK, track_id)
     db.commit()
+    catalog_snapshot.request_refresh()
+    price_cache.invalidate("track", track_id)
     return None
@@ -1,20 +1,26 @@
 from datetime import timedelta
 from typing import List, Optional, Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from passlib.context import CryptContext
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 import models
+from datamanager.counts import count_total, set_total_count
 from datamanager.database import get_db
-from schemas import user_schemas
+from datamanager.revocation import revocation_list
+from datamanager.user_import import export_users, import_users, CSV, NDJSON
+from datamanager.entitlements import owned_track_ids
+from schemas import user_schemas, track_schemas, batch_schemas
 from schemas.user_schemas import UserRole
 from auth_utils import (
-    verify_password,
+    verify_and_update_password,
+    get_password_hash,
     create_access_token,
     get_current_entity,
+    load_entity,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 
@@ -23,15 +29,9 @@ router = APIRouter(
     tags=["users"]
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_user_scheme = OAuth2PasswordBearer(tokenUrl="users/token", scheme_name="UserAuth")
 
 
-# Security utility functions
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-
 def create_admin_user(db: Session, user_data: user_schemas.UserCreate):
     hashed_password = get_password_hash(user_data.password)
     db_user = models.User(
@@ -90,17 +90,25 @@ async def login_for_access_token(
     db: Session = Depends(get_db)
 ) -> user_schemas.Token:
     user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.password):
+    verified, new_hash = (verify_and_update_password(form_data.password, user.password)
+                          if user else (False, None))
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    if new_hash:
+        # Upgrade hashes made with an older cost setting
+        user.password = new_hash
+        db.commit()
+
     access_token = create_access_token(
         data={"sub": user.id},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
-        token_type="user"
+        token_type="user",
+        entity=user
     )
     return user_schemas.Token(access_token=access_token, token_type="bearer")
 
@@ -146,18 +154,54 @@ def create_user(user: user_schemas.UserCreate, db: Session = Depends(get_db)):
 
 
 @router.get("/me", response_model=user_schemas.UserResponse)
-async def read_users_me(
-        current_user: Annotated[models.User, Depends(get_current_active_user)]
+def read_users_me(
+        current_user: Annotated[models.User, Depends(get_current_active_user)],
+        db: Session = Depends(get_db)
 ):
-    return current_user
+    return load_entity(db, current_user)
+
+
+@router.get("/me/library", response_model=List[track_schemas.TrackResponse])
+def read_users_me_library(
+        current_user: Annotated[models.User, Depends(get_current_active_user)],
+        skip: int = 0,
+        limit: int = 100,
+        db: Session = Depends(get_db)
+):
+    owned_ids = (
+        db.query(models.Entitlement.track_id)
+        .filter(models.Entitlement.user_id == current_user.id)
+        .distinct()
+        .subquery()
+    )
+    return (
+        db.query(models.Track)
+        .join(owned_ids, owned_ids.c.track_id == models.Track.id)
+        .order_by(models.Track.id)
+        .offset(skip).limit(limit).all()
+    )
+
+
+@router.post("/me/library/owned", response_model=user_schemas.OwnedTracksResponse)
+def check_users_me_owned_tracks(
+        current_user: Annotated[models.User, Depends(get_current_active_user)],
+        batch: batch_schemas.BatchRequest,
+        db: Session = Depends(get_db)
+):
+    """
+    Return which of the given track ids the current user owns.
+    """
+    return {"owned": owned_track_ids(db, current_user.id, batch.ids)}
 
 
 @router.get("/", response_model=List[user_schemas.UserResponse])
 def get_users(
+    response: Response,
     current_user: Annotated[models.User, Depends(get_current_admin_user)],
     user_id: Optional[int] = None,
     skip: int = 0,
     limit: int = 100,
+    include_total: bool = Query(False, description="Send the number of users in X-Total-Count"),
     db: Session = Depends(get_db)
 ):
     query = db.query(models.User)
@@ -171,9 +215,47 @@ def get_users(
             )
         return [user]
 
+    if include_total:
+        set_total_count(response, *count_total(db, query))
     return query.offset(skip).limit(limit).all()
 
 
+IMPORT_MEDIA_TYPES = {CSV: "text/csv", NDJSON: "application/x-ndjson"}
+
+
+@router.post("/import", response_model=user_schemas.UserImportReport)
+async def import_user_list(
+        request: Request,
+        current_user: Annotated[models.User, Depends(get_current_admin_user)],
+        format: Optional[str] = Query(None, pattern="^(csv|ndjson)$", description="Defaults from the Content-Type"),
+        allow_admin: bool = Query(False, description="Also import rows with the admin role")
+):
+    """
+    Bulk create users from a streamed CSV (header line first) or NDJSON body.
+    Each row needs either `password` or an existing bcrypt `password_hash`.
+    Rows that fail validation or clash with existing users are reported by
+    line number; the rest are imported. Admin rows are rejected unless
+    `allow_admin` is set.
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = CSV if content_type.startswith("text/csv") else NDJSON
+    return await import_users(request.stream(), format, allow_admin)
+
+
+@router.get("/export")
+def export_user_list(
+        current_user: Annotated[models.User, Depends(get_current_admin_user)],
+        format: str = Query(NDJSON, pattern="^(csv|ndjson)$")
+):
+    """Stream every user as CSV or NDJSON. Password hashes are never exported."""
+    return StreamingResponse(
+        export_users(format),
+        media_type=IMPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'}
+    )
+
+
 @router.put("/{user_id}", response_model=user_schemas.UserResponse)
 def update_user(
         user_id: int,
@@ -212,6 +294,9 @@ def update_user(
     try:
         db.commit()
         db.refresh(db_user)
+        # Tokens carrying the old role or credentials must stop working
+        if "role" in update_data or "password" in update_data:
+            revocation_list.revoke_subject("user", user_id)
         return db_user
     except IntegrityError:
         db.rollback()
@@ -221,6 +306,29 @@ def update_user(
         )
 
 
+@router.post("/{user_id}/disable", response_model=user_schemas.UserResponse)
+def disable_user(
+        user_id: int,
+        current_user: Annotated[models.User, Depends(get_current_admin_user)],
+        db: Session = Depends(get_db)
+):
+    """
+    Disable a user account and revoke its outstanding tokens. Admins only.
+    """
+    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    if db_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    db_user.disabled = True
+    db.commit()
+    db.refresh(db_user)
+    revocation_list.revoke_subject("user", user_id)
+    return db_user
+
+
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_user(
         user_id: int,
@@ -233,13 +341,16 @@ def delete_user(
             detail="Not authorized to delete this user"
         )
 
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
-    if db_user is None:
+    # Single DELETE statement, dependent rows are removed by ON DELETE CASCADE
+    deleted = (db.query(models.User)
+               .filter(models.User.id == user_id)
+               .delete(synchronize_session=False))
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
 
-    db.delete(db_user)
     db.commit()
+    revocation_list.revoke_subject("user", user_id)
     return None
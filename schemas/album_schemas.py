@@ -52,3 +52,33 @@ class AlbumResponse(AlbumBase):
         json_encoders = {
             date: lambda v: v.isoformat()
         }
+
+
+class AlbumBatchResponse(BaseModel):
+    items: List[Optional[AlbumResponse]]
+    missing: List[int]
+
+
+class AlbumDetailTrack(BaseModel):
+    id: int
+    name: str
+    release_date: date
+    price: Optional[float] = None
+    path: str
+
+    class Config:
+        from_attributes = True
+
+
+class AlbumDetailArtist(BaseModel):
+    id: int
+    name: str
+    genre: str
+
+    class Config:
+        from_attributes = True
+
+
+class AlbumDetailResponse(AlbumResponse):
+    tracks: Optional[List[AlbumDetailTrack]] = None
+    artist: Optional[AlbumDetailArtist] = None
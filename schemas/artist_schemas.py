@@ -1,5 +1,5 @@
 from datetime import date, datetime
-from typing import Optional
+from typing import Optional, List
 from enum import Enum
 from pydantic import BaseModel, EmailStr
 
@@ -48,3 +48,39 @@ class ArtistResponse(ArtistBase):
         json_encoders = {
             date: lambda v: v.isoformat()
         }
+
+
+class ArtistBatchResponse(BaseModel):
+    items: List[Optional[ArtistResponse]]
+    missing: List[int]
+
+
+class SalesDay(BaseModel):
+    day: date
+    revenue: float
+    units: int
+
+    class Config:
+        from_attributes = True
+
+
+class SalesItem(BaseModel):
+    type: str
+    item_id: int
+    revenue: float
+    units: int
+
+    class Config:
+        from_attributes = True
+
+
+class ArtistSalesResponse(BaseModel):
+    daily: List[SalesDay]
+    items: List[SalesItem]
+
+
+class SimilarArtistResponse(BaseModel):
+    id: int
+    name: str
+    genre: str
+    score: float
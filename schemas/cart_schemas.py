@@ -0,0 +1,26 @@
+from typing import List
+
+from pydantic import BaseModel, Field
+
+
+class CartLineSet(BaseModel):
+    item_id: int
+    type: str
+    quantity: int = Field(1, ge=1)
+
+
+class CartLineResponse(BaseModel):
+    item_id: int
+    type: str
+    quantity: int
+    price: float
+    subtotal: float
+
+
+class CartResponse(BaseModel):
+    lines: List[CartLineResponse]
+    total: float
+
+
+class CartCheckout(BaseModel):
+    payment_method_id: int
@@ -1,7 +1,7 @@
 from datetime import date
-from typing import Optional
+from typing import Optional, List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class OrderItemBase(BaseModel):
@@ -23,11 +23,24 @@ class OrderItemUpdate(BaseModel):
 
 class OrderItemResponse(OrderItemBase):
     id: int
-    price: float
-    subtotal: float
+    price: Optional[float] = None
+    subtotal: Optional[float] = None
 
     class Config:
         from_attributes = True
         json_encoders = {
             date: lambda v: v.isoformat()
         }
+
+
+class OrderItemUpsert(BaseModel):
+    """Update the order item with `id`, or add a new item when `id` is omitted."""
+    id: Optional[int] = None
+    item_id: Optional[int] = None
+    type: Optional[str] = None
+    quantity: Optional[int] = Field(None, ge=1)
+
+
+class OrderItemsPatch(BaseModel):
+    upserts: List[OrderItemUpsert] = []
+    deletes: List[int] = []
@@ -1,8 +1,10 @@
 from datetime import datetime, date
-from typing import Optional
+from typing import Optional, List
 
 from pydantic import BaseModel
 
+from schemas.order_items_schemas import OrderItemResponse
+
 
 class OrderBase(BaseModel):
     user_id: int
@@ -29,3 +31,13 @@ class OrderResponse(OrderBase):
         json_encoders = {
             date: lambda v: v.isoformat()
         }
+
+
+class OrderWithItemsResponse(OrderResponse):
+    items: List[OrderItemResponse]
+
+
+class OrderHistoryResponse(OrderResponse):
+    items: Optional[List[OrderItemResponse]] = None
+    item_count: Optional[int] = None
+    units: Optional[int] = None
@@ -0,0 +1,35 @@
+from datetime import datetime
+from typing import Optional, List
+
+from pydantic import BaseModel, Field
+
+MAX_PLAY_BATCH_SIZE = 500
+
+
+class PlayCreate(BaseModel):
+    track_id: int
+    played_at: Optional[datetime] = None
+
+
+class PlayBatchCreate(BaseModel):
+    plays: List[PlayCreate] = Field(..., min_length=1, max_length=MAX_PLAY_BATCH_SIZE)
+
+
+class PlayAccepted(BaseModel):
+    accepted: int
+
+
+class PlayResponse(BaseModel):
+    track_id: int
+    played_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class PlayBufferMetrics(BaseModel):
+    depth: int
+    flushes: int
+    flushed_rows: int
+    failed_flushes: int
+    last_flush_ms: float
@@ -1,5 +1,5 @@
 from datetime import date
-from typing import Optional
+from typing import Optional, List
 
 from pydantic import BaseModel
 
@@ -34,3 +34,23 @@ class TrackResponse(TrackBase):
         json_encoders = {
             date: lambda v: v.isoformat()
         }
+
+
+class TrackBatchResponse(BaseModel):
+    items: List[Optional[TrackResponse]]
+    missing: List[int]
+
+
+class TrackPeaksResponse(BaseModel):
+    track_id: int
+    buckets: int
+    min: List[float]
+    max: List[float]
+
+
+class TrackUpload(BaseModel):
+    artist_id: int
+    album_id: int
+    name: str
+    release_date: date
+    price: float
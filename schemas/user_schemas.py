@@ -1,7 +1,9 @@
 from datetime import date, datetime
-from typing import Optional
+from typing import Optional, List
 from enum import Enum
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, model_validator
+
+from password_hashing import pwd_context
 
 
 class Token(BaseModel):
@@ -49,3 +51,34 @@ class UserResponse(UserBase):
         json_encoders = {
             date: lambda v: v.isoformat()
         }
+
+
+class OwnedTracksResponse(BaseModel):
+    owned: List[int]
+
+
+class UserImportRow(UserBase):
+    """One imported user: a plain password to hash, or an existing bcrypt hash to keep."""
+    password: Optional[str] = None
+    password_hash: Optional[str] = None
+    disabled: bool = False
+
+    @model_validator(mode="after")
+    def one_password(self):
+        if (self.password is None) == (self.password_hash is None):
+            raise ValueError("Exactly one of password and password_hash is required")
+        if self.password_hash is not None and pwd_context.identify(self.password_hash) is None:
+            raise ValueError("password_hash is not a bcrypt hash")
+        return self
+
+
+class UserImportError(BaseModel):
+    line: int
+    error: str
+
+
+class UserImportReport(BaseModel):
+    imported: int
+    failed: int
+    errors: List[UserImportError]
+    errors_truncated: bool
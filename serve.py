@@ -0,0 +1,104 @@
+"""
+Production launcher for the HarmonApp API.
+
+    python serve.py
+
+All settings come from environment variables (or the .env file):
+
+    HOST                       bind address (default 0.0.0.0)
+    PORT                       bind port (default 8000)
+    WEB_CONCURRENCY            worker processes (default: one per CPU core)
+    LIMIT_CONCURRENCY          max concurrent connections per worker before 503 (default 1000)
+    BACKLOG                    listen socket backlog (default 2048)
+    KEEP_ALIVE_TIMEOUT         idle keep-alive timeout in seconds (default 5)
+    GRACEFUL_SHUTDOWN_TIMEOUT  seconds to drain in-flight requests on shutdown (default 30)
+    MAX_REQUESTS               recycle a worker after this many requests (default 0, never)
+    PRELOAD                    "1" to run under gunicorn with the app preloaded before fork
+
+Workers use uvloop and httptools. Each worker gets its own database pool: the
+engine's pool is dropped after fork (see datamanager.database). Sending SIGHUP to
+the uvicorn supervisor restarts the workers one by one.
+"""
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APP = "main:app"
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def get_settings() -> dict:
+    return {
+        "host": os.environ.get("HOST", "0.0.0.0"),
+        "port": _env_int("PORT", 8000),
+        "workers": _env_int("WEB_CONCURRENCY", multiprocessing.cpu_count()),
+        "limit_concurrency": _env_int("LIMIT_CONCURRENCY", 1000),
+        "backlog": _env_int("BACKLOG", 2048),
+        "timeout_keep_alive": _env_int("KEEP_ALIVE_TIMEOUT", 5),
+        "timeout_graceful_shutdown": _env_int("GRACEFUL_SHUTDOWN_TIMEOUT", 30),
+        "limit_max_requests": _env_int("MAX_REQUESTS", 0) or None,
+    }
+
+
+def run_uvicorn(settings: dict) -> None:
+    import uvicorn
+
+    uvicorn.run(
+        APP,
+        loop="uvloop",
+        http="httptools",
+        proxy_headers=True,
+        access_log=False,
+        **settings
+    )
+
+
+def run_gunicorn(settings: dict) -> None:
+    """Preload the app once in the master and fork workers from it."""
+    from gunicorn.app.base import BaseApplication
+    from uvicorn.workers import UvicornWorker
+
+    class TunedUvicornWorker(UvicornWorker):
+        # UvicornWorker only takes keep-alive, max requests and backlog from
+        # the gunicorn config; everything else reaches uvicorn through here
+        CONFIG_KWARGS = {
+            **UvicornWorker.CONFIG_KWARGS,
+            "loop": "uvloop",
+            "http": "httptools",
+            "access_log": False,
+            "limit_concurrency": settings["limit_concurrency"],
+            "timeout_graceful_shutdown": settings["timeout_graceful_shutdown"],
+        }
+
+    class PreloadedApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{settings['host']}:{settings['port']}")
+            self.cfg.set("workers", settings["workers"])
+            self.cfg.set("worker_class", TunedUvicornWorker)
+            self.cfg.set("backlog", settings["backlog"])
+            self.cfg.set("keepalive", settings["timeout_keep_alive"])
+            self.cfg.set("graceful_timeout", settings["timeout_graceful_shutdown"])
+            self.cfg.set("max_requests", settings["limit_max_requests"] or 0)
+            self.cfg.set("max_requests_jitter", (settings["limit_max_requests"] or 0) // 10)
+            self.cfg.set("preload_app", True)
+
+        def load(self):
+            from main import app
+            return app
+
+    PreloadedApplication().run()
+
+
+if __name__ == "__main__":
+    server_settings = get_settings()
+    if os.environ.get("PRELOAD") == "1":
+        run_gunicorn(server_settings)
+    else:
+        run_uvicorn(server_settings)
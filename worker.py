@@ -0,0 +1,61 @@
+"""
+Background worker that processes queued jobs (order checkout and its
+post-purchase steps).
+
+    python worker.py
+
+Environment variables:
+
+    WORKER_BATCH_SIZE      jobs claimed per poll (default 20)
+    WORKER_POLL_INTERVAL   seconds to sleep when the queue is empty (default 1)
+
+Run several workers side by side; on PostgreSQL they claim disjoint batches.
+"""
+import logging
+import os
+import signal
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from datamanager.database import SessionLocal  # noqa: E402
+from datamanager.jobs import claim_batch, run_job  # noqa: E402
+
+WORKER_BATCH_SIZE = int(os.environ.get('WORKER_BATCH_SIZE', 20))
+WORKER_POLL_INTERVAL = float(os.environ.get('WORKER_POLL_INTERVAL', 1))
+
+logger = logging.getLogger("harmonapp.worker")
+_running = True
+
+
+def _stop(signum, frame):
+    global _running
+    _running = False
+
+
+def run_once(batch_size: int = WORKER_BATCH_SIZE) -> int:
+    """Claim and run one batch of jobs. Returns the number of jobs claimed."""
+    db = SessionLocal()
+    try:
+        jobs = claim_batch(db, batch_size)
+        for job in jobs:
+            run_job(db, job)
+            logger.info("job %s (%s, order %s): %s", job.id, job.kind, job.order_id, job.status)
+        return len(jobs)
+    finally:
+        db.close()
+
+
+def main():
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    while _running:
+        if run_once() == 0:
+            time.sleep(WORKER_POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    main()